@@ -0,0 +1,223 @@
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+import argparse
+import logging
+import asyncio
+import json
+import time
+import sys
+import os
+
+# Needed to import the modules of Oscar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Benchmark import fakes
+from telegram import Update
+import Oscar
+
+# Constants
+PATH_BASELINE = os.path.dirname(os.path.abspath(__file__)) + "/baseline.json"
+COMMANDS = ["time", "weather", "transport", "calendar", "calendar list", "plan"]
+REQUESTS = 200 # per command
+CONCURRENCY = 20 # number of requests in flight at the same time
+USERS = 20
+# Upstreams a command must call, at least during the warmup (the measured requests may all be cache hits)
+EXPECTED_UPSTREAMS = {"calendar": ["google calendar", "directions"]}
+REPEAT = 3 # runs of each command, compared by their median (see aggregate)
+TOLERANCE = 0.25 # relative degradation allowed before failing
+FLOOR = 0.005 # in seconds, latency increases below it are noise, whatever the tolerance
+MIN_P99_SAMPLES = 500 # below, the p99 is a handful of requests and is not compared
+
+
+class FakeBot:
+    """Bot stand-in: the answers are kept instead of being sent to Telegram."""
+
+    defaults = None
+
+    def __init__(self):
+        self.replies = 0
+
+    async def send_message(self, *args, **kwargs):
+        self.replies += 1
+
+
+def make_update(update_id: int, user_id: int, text: str, bot: FakeBot) -> Update:
+    """Builds the Telegram update of a private text message."""
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": user,
+            "text": text,
+        },
+    }
+    return Update.de_json(data, bot)
+
+
+async def run_command(text: str, requests: int, concurrency: int, users: int, warmup: int) -> dict:
+    """Sends requests messages through Oscar.handle_input, at most concurrency at a time, and measures their latency.
+    The first warmup requests are not measured (caches are empty before them, see fakes.reset).
+
+    Returns:
+        dict: throughput, latencies (in seconds), errors and upstream_calls of the run.
+    """
+    bot = FakeBot()
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def send(i: int, measured: bool):
+        nonlocal errors
+        update = make_update(i, i % users + 1, text, bot)
+
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await Oscar.handle_input(update, None)
+            except Exception:
+                errors += 1
+            if measured:
+                latencies.append(time.perf_counter() - start)
+
+    fakes.reset()
+    await asyncio.gather(*(send(i, False) for i in range(warmup)))
+
+    calls_before = fakes.get_calls()
+    start = time.perf_counter()
+    await asyncio.gather(*(send(i, True) for i in range(warmup, warmup + requests)))
+    elapsed = time.perf_counter() - start
+    calls = {name: count - calls_before[name] for name, count in fakes.get_calls().items() if count > calls_before[name]}
+
+    # A command silently answering without its upstreams (e.g. from fixtures) would not measure anything
+    missed = [name for name in EXPECTED_UPSTREAMS.get(text, []) if not fakes.get_calls()[name]]
+    if missed:
+        raise RuntimeError(f"{text!r} never called {', '.join(missed)}: the benchmark does not cover its upstreams")
+
+    return {
+        "throughput": requests / elapsed, # requests per second
+        "latencies": latencies,
+        "errors": errors,
+        "upstream_calls": calls,
+    }
+
+
+def aggregate(runs: list) -> dict:
+    """Summarises the runs of a command: median throughput and p50 over the runs, p99 over the latencies of all
+    the runs (a single run has too few requests in its tail), worst number of errors."""
+    latencies = np.concatenate([run["latencies"] for run in runs])
+
+    return {
+        "throughput": float(np.median([run["throughput"] for run in runs])),
+        "p50": float(np.median([np.percentile(run["latencies"], 50) for run in runs])), # in seconds
+        "p99": float(np.percentile(latencies, 99)), # in seconds
+        "samples": int(latencies.size),
+        "errors": max(run["errors"] for run in runs),
+        "upstream_calls": runs[-1]["upstream_calls"],
+    }
+
+
+async def run(commands: list, requests: int, concurrency: int, users: int, warmup: int, repeat: int = REPEAT) -> dict:
+    results = {}
+
+    # Oscar prints every message it receives
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for command in commands:
+            runs = [await run_command(command, requests, concurrency, users, warmup) for _ in range(repeat)]
+            results[command] = aggregate(runs)
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float, floor: float = FLOOR, min_p99_samples: int = MIN_P99_SAMPLES) -> list:
+    """Returns the regressions of the results against the baseline: throughput lower, or latency higher, by more than
+    tolerance. A latency must also be higher by more than floor seconds, and the p99 is only compared when both
+    the results and the baseline have at least min_p99_samples requests."""
+    regressions = []
+
+    for command, result in results.items():
+        reference = baseline.get(command)
+        if reference is None:
+            continue
+
+        if result["throughput"] < reference["throughput"] * (1 - tolerance):
+            regressions.append(f"{command}: throughput {result['throughput']:.1f}/s < {reference['throughput']:.1f}/s")
+
+        keys = ["p50"]
+        if min(result["samples"], reference.get("samples", 0)) >= min_p99_samples:
+            keys.append("p99")
+
+        for key in keys:
+            if result[key] > reference[key] * (1 + tolerance) and result[key] - reference[key] > floor:
+                regressions.append(f"{command}: {key} {result[key] * 1000:.0f}ms > {reference[key] * 1000:.0f}ms")
+
+        if result["errors"] > reference.get("errors", 0):
+            regressions.append(f"{command}: {result['errors']} errors > {reference.get('errors', 0)}")
+
+    return regressions
+
+
+def parse_latency(values: list) -> dict:
+    """"sbb=0.1" -> {"sbb": 0.1}"""
+    latency = {}
+
+    for value in values:
+        name, seconds = value.rsplit("=", 1)
+        if name not in fakes.LATENCY:
+            raise argparse.ArgumentTypeError(f"Unknown upstream {name!r}, expected one of {list(fakes.LATENCY)}")
+        latency[name] = float(seconds)
+
+    return latency
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline latency benchmark of Oscar's commands, with fake upstreams.")
+    parser.add_argument("--commands", nargs="+", default=COMMANDS, help="messages to send, e.g. weather \"calendar list\"")
+    parser.add_argument("--requests", type=int, default=REQUESTS, help="measured requests per command")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="requests in flight at the same time")
+    parser.add_argument("--users", type=int, default=USERS, help="number of distinct users")
+    parser.add_argument("--warmup", type=int, default=None, help="requests sent before measuring (default: concurrency)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="runs of each command, compared by their median")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="UPSTREAM=SECONDS", help=f"injected latencies, upstreams: {', '.join(fakes.LATENCY)}")
+    parser.add_argument("--jitter", type=float, default=0., help="relative variation of the latencies, e.g. 0.2")
+    parser.add_argument("--baseline", default=PATH_BASELINE, help="baseline file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative degradation allowed")
+    parser.add_argument("--floor", type=float, default=FLOOR, help="latency increase (in seconds) always allowed")
+    parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    fakes.install(args.users, parse_latency(args.latency), args.jitter)
+
+    config = {"requests": args.requests, "repeat": args.repeat, "concurrency": args.concurrency, "users": args.users, "latency": dict(fakes.LATENCY), "jitter": args.jitter}
+    warmup = args.concurrency if args.warmup is None else args.warmup
+    results = asyncio.run(run(args.commands, args.requests, args.concurrency, args.users, warmup, args.repeat))
+
+    for command, result in results.items():
+        print(f"{command:>15}: {result['throughput']:8.1f} req/s | p50 {result['p50'] * 1000:7.1f}ms | p99 {result['p99'] * 1000:7.1f}ms | {result['errors']} errors | upstream calls {result['upstream_calls']}")
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as json_file:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "config": config, "results": results}, json_file, indent=4)
+        print(f"Baseline stored in {args.baseline}")
+        return 0
+
+    with open(args.baseline, "r") as json_file:
+        baseline = json.load(json_file)
+
+    if baseline["config"] != config:
+        print(f"The configuration differs from the baseline's ({baseline['config']}): results are not compared.")
+        return 0
+
+    regressions = compare(results, baseline["results"], args.tolerance, args.floor)
+
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
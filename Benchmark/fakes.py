@@ -0,0 +1,295 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import threading
+import tempfile
+import hashlib
+import shutil
+import atexit
+import random
+import json
+import time
+import sys
+import os
+
+# Needed to import the modules of Oscar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils import settings
+from Weather import Forecast, Weather
+from Transport import Stationboard
+from Calendar import Sync, Calendar, Events
+from Route import Route, Directions, Geocoding, Estimator
+
+# Constants
+PATH_FIXTURES = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + "/Route/Data"
+CENTER = (46.5197, 6.6323) # Lausanne
+STATIONS = ["Lausanne", "Lausanne-Flon", "Ouchy-Olympique", "Renens VD", "EPFL"]
+ADDRESSES = ["Rolex Learning Center, Ecublens", "Ouchy Olympique, Lausanne", "Place de la Palud, Lausanne", "Gare de Renens", "Vidy, Lausanne"]
+LINES = [("m1", "Renens VD"), ("m2", "Croisettes"), ("1", "Maladière-Lac"), ("701", "Bussigny"), ("S2", "Palézieux")]
+FIXTURE_ROUTES = {"walking": "route_walk.json", "bicycling": "route_walk.json", "transit": "route_transit.json", "driving": "route_car.json"}
+
+# Injected latency (in seconds) of each upstream
+LATENCY = {
+    "sbb": 0.05,
+    "open-meteo": 0.2,
+    "google calendar": 0.3,
+    "directions": 0.15,
+    "nominatim": 0.1,
+    "openrouteservice": 0.2,
+}
+
+_LOCK = threading.Lock()
+_CALLS = {name: 0 for name in LATENCY} # number of calls of each fake upstream
+_JITTER = 0.
+_DIRECTORY = None # temporary directory of the on-disk caches, replaced by each reset
+
+
+def upstream(name: str):
+    """Simulates the round trip to an upstream: waits its latency (+/- the jitter) and counts the call."""
+    with _LOCK:
+        _CALLS[name] += 1
+
+    latency = LATENCY[name]
+    time.sleep(max(0., latency * (1 + random.uniform(-_JITTER, _JITTER))))
+
+
+def get_calls() -> dict:
+    with _LOCK:
+        return dict(_CALLS)
+
+
+def make_snapshot(nb_users: int) -> settings.Snapshot:
+    """Settings with nb_users users around Lausanne, each with a stop and two calendars."""
+    rng = random.Random(0)
+    data = {
+        "ID_MAIN": "1",
+        "BOT_TOKEN": "benchmark",
+        "URL_SBB": "http://localhost/stationboard",
+        "URL_OPEN_METEO": "http://localhost/v1/forecast",
+        "WEATHER_GRID_STEP": Forecast.GRID_STEP,
+        "SBB_STARTING_STOP": STATIONS[0],
+        # Routes are requested (to FakeGoogleMaps) instead of read from the recorded files of Route/Data
+        "ROUTE_SIMULATION": False,
+    }
+
+    for i in range(1, nb_users + 1):
+        data[str(i)] = {
+            "ID": str(i),
+            "COORDINATES": {"LAT": f"{CENTER[0] + rng.uniform(-0.05, 0.05):.5f}", "LON": f"{CENTER[1] + rng.uniform(-0.05, 0.05):.5f}"},
+            "STOP": STATIONS[i % len(STATIONS)],
+            "CALENDARS": {f"user{i}-{k}@benchmark": 0 for k in range(2)},
+        }
+
+    users = {key: settings._parse_user(key, entry, data["SBB_STARTING_STOP"]) for key, entry in data.items() if isinstance(entry, dict)}
+
+    return settings.Snapshot(version=("benchmark", nb_users), data=data, users=users)
+
+
+def make_stationboard(station: str, limit: int) -> dict:
+    """Stationboard (SBB API format) of the next limit departures, every 3 minutes from now."""
+    now = datetime.now(timezone(timedelta(hours=2)))
+    departures = []
+
+    for i in range(limit):
+        number, to = LINES[i % len(LINES)]
+        departure = (now + timedelta(minutes=3 * (i + 1))).strftime("%Y-%m-%dT%H:%M:%S%z")
+        departures.append({"stop": {"station": {"name": station}, "departure": departure, "delay": i % 3}, "to": to, "number": number})
+
+    return {"station": {"name": station, "coordinate": {"x": CENTER[0], "y": CENTER[1]}}, "stationboard": departures}
+
+
+def make_forecast(cell: tuple) -> tuple:
+    """Forecast (hourly dataframe, daily dataframe) in the format of Forecast.process_response, from yesterday on."""
+    rng = np.random.default_rng(abs(hash(cell)) % 2**32)
+    start = pd.Timestamp.now(tz="UTC").normalize() - pd.Timedelta(days=1)
+
+    hours = pd.date_range(start=start, periods=5 * 24, freq="h")
+    precipitation = np.where(rng.random(hours.size) < 0.2, rng.gamma(1., 1., hours.size), 0.)
+    hourly = pd.DataFrame({
+        "date": hours,
+        "temperature_2m": rng.normal(15, 5, hours.size),
+        "relative_humidity_2m": rng.uniform(40, 90, hours.size),
+        "precipitation": precipitation,
+        "weather_code": np.where(precipitation > 0, 61, 2).astype(float),
+        "cloud_cover": rng.uniform(0, 100, hours.size),
+        "uv_index": rng.uniform(0, 6, hours.size),
+        "is_day": ((hours.hour >= 6) & (hours.hour < 20)).astype(float),
+    })
+
+    days = pd.date_range(start=start, periods=5, freq="D")
+    daily = pd.DataFrame({
+        "date": days,
+        "weather_code": np.full(days.size, 61.),
+        "temperature_2m_max": rng.normal(20, 3, days.size),
+        "temperature_2m_min": rng.normal(10, 3, days.size),
+        "uv_index_max": rng.uniform(0, 8, days.size),
+        "precipitation_sum": rng.uniform(0, 10, days.size),
+        "precipitation_hours": rng.uniform(0, 10, days.size),
+    })
+
+    return hourly, daily
+
+
+def make_calendar_items(calendar_id: str, days: int = 14) -> list:
+    """Raw events (Google Calendar API format) of a calendar: three events a day for the next days."""
+    rng = random.Random(calendar_id)
+    today = datetime.now().astimezone().replace(hour=0, minute=0, second=0, microsecond=0)
+    items = []
+
+    for day in range(days):
+        for hour in (9, 13, 17):
+            start = today + timedelta(days=day, hours=hour + rng.choice((0, 0.5)))
+            items.append({
+                "id": hashlib.sha1(f"{calendar_id}{start}".encode()).hexdigest(),
+                "status": "confirmed",
+                "summary": f"Event {day}-{hour}",
+                "location": rng.choice(ADDRESSES),
+                "start": {"dateTime": start.isoformat()},
+                "end": {"dateTime": (start + timedelta(hours=1)).isoformat()},
+            })
+
+    return items
+
+
+class FakeGeolocator:
+    """Nominatim stand-in: deterministic coordinates around Lausanne."""
+
+    def geocode(self, address: str):
+        upstream("nominatim")
+        digest = hashlib.sha1(address.lower().encode()).digest()
+        return SimpleNamespace(latitude=CENTER[0] + (digest[0] - 128) / 5000, longitude=CENTER[1] + (digest[1] - 128) / 5000)
+
+
+class FakeGoogleMaps:
+    """Google Maps client stand-in: answers the Directions requests with the recorded responses of Route/Data."""
+
+    def __init__(self):
+        self.routes = {}
+        for mode, file_name in FIXTURE_ROUTES.items():
+            with open(f"{PATH_FIXTURES}/{file_name}", "r") as json_file:
+                self.routes[mode] = json.load(json_file)
+
+    def directions(self, origin: str, destination: str, mode: str = "walking", **kwargs) -> list:
+        upstream("directions")
+        return self.routes[mode]
+
+
+class FakeOpenrouteservice:
+    """Openrouteservice client stand-in: matrices are computed by the offline estimator."""
+
+    MODES = {"foot-walking": "walking", "cycling-regular": "bicycling", "driving-car": "driving"}
+
+    def distance_matrix(self, locations: list, profile: str = "foot-walking", **kwargs) -> dict:
+        upstream("openrouteservice")
+        lon, lat = np.array(locations, dtype=float).T
+        distances, durations = Estimator.estimate(lat[:, None], lon[:, None], lat[None, :], lon[None, :], self.MODES.get(profile, "walking"))
+        return {"durations": durations.tolist(), "distances": distances.tolist()}
+
+
+def fake_fetch_stationboard(station: str, limit: int, base_url: str = None) -> dict:
+    upstream("sbb")
+    return make_stationboard(station, limit)
+
+
+def fake_fetch_forecasts(cells: list) -> list:
+    upstream("open-meteo")
+    return [make_forecast(cell) for cell in cells]
+
+
+def fake_list_changes(store: Sync.CalendarStore, gc, sync_token: str) -> tuple:
+    upstream("google calendar")
+    # Incremental synchronisations have nothing new
+    items = [] if sync_token else make_calendar_items(store.calendar_id)
+    return items, f"token-{store.calendar_id}"
+
+
+def fake_iter_window(calendar_id: str, t0: int, t1: int = None, offset: float = 0, credential_path: str = None, page_size: int = None):
+    upstream("google calendar")
+    records = sorted((Events.from_item(item, calendar_id, offset) for item in make_calendar_items(calendar_id)), key=lambda record: record.start)
+
+    for record in records:
+        if record.end > t0 and (t1 is None or record.start < t1):
+            yield record
+
+
+def install(nb_users: int, latency: dict = None, jitter: float = 0., real: tuple = (), parameters: dict = None):
+    """Replaces every upstream of Oscar (SBB, Open-Meteo, Google Calendar, Directions, Nominatim, Openrouteservice)
+    by a fake answering from fixtures after the injected latency. The settings are replaced by nb_users synthetic users.
+
+    Args:
+        nb_users (int): number of users.
+        latency (dict, optional): latency (in seconds) of some upstreams, overriding LATENCY. Defaults to None.
+        jitter (float, optional): relative variation of the latencies, e.g. 0.2 for +/- 20%. Defaults to 0.
+        real (tuple, optional): upstreams kept real, e.g. ("sbb",) when pointing URL_SBB to a stand-in. Defaults to ().
+        parameters (dict, optional): settings overriding the synthetic ones, e.g. {"URL_SBB": ...}. Defaults to None.
+    """
+    global _JITTER
+    LATENCY.update(latency or {})
+    _JITTER = jitter
+
+    snapshot = make_snapshot(nb_users)
+    snapshot.data.update(parameters or {})
+    settings.get_snapshot = lambda: snapshot
+
+    if "sbb" not in real:
+        Stationboard.fetch_stationboard = fake_fetch_stationboard
+    if "open-meteo" not in real:
+        Forecast.fetch_forecasts = fake_fetch_forecasts
+    if "google calendar" not in real:
+        Sync.CalendarStore._list_changes = fake_list_changes
+        Sync.iter_window = fake_iter_window
+        Sync.get_client = lambda credential_path=Sync.CREDENTIAL_PATH: (None, threading.Lock())
+    # Real clients are created from the (overridden) settings on first use
+    Directions._CLIENT = FakeGoogleMaps() if "directions" not in real else None
+    if "nominatim" not in real:
+        Geocoding._GEOLOCATOR = FakeGeolocator()
+    Route._ORS_CLIENT = FakeOpenrouteservice() if "openrouteservice" not in real else None
+
+    reset()
+
+
+def reset():
+    """Empties every cache, in memory and on disk (on-disk caches are moved to a new temporary directory,
+    the previous one is deleted)."""
+    global _DIRECTORY
+    previous, directory = _DIRECTORY, tempfile.mkdtemp(prefix="oscar-benchmark-")
+    _DIRECTORY = directory
+
+    with Forecast._LOCK:
+        Forecast._CACHE.clear()
+    with Stationboard._LOCK:
+        Stationboard._CACHE.clear()
+    with Weather._SUMMARIES_LOCK:
+        Weather._SUMMARIES.clear()
+    with Sync._LOCK:
+        Sync._STORES.clear()
+        Sync.PATH_STORE = directory + "/calendar"
+    Calendar._INDEXES.clear()
+
+    with Directions._LOCK:
+        Directions._MEMORY.clear()
+        Directions._DB = None
+        Directions.PATH_CACHE = directory + "/directions.sqlite"
+        Directions._STATS.update(hits=0, misses=0)
+    with Geocoding._LOCK:
+        Geocoding._LRU.clear()
+        Geocoding._DB = None
+        Geocoding.PATH_CACHE = directory + "/geocode.sqlite"
+    # The estimator is calibrated on the fixtures and the routes of this run only, not on the local Directions cache
+    with Estimator._LOCK:
+        Estimator._MODEL = None
+        Estimator.PATH_DIRECTIONS_CACHE = Directions.PATH_CACHE
+
+    if previous:
+        shutil.rmtree(previous, ignore_errors=True)
+
+    with _LOCK:
+        for name in _CALLS:
+            _CALLS[name] = 0
+
+
+@atexit.register
+def _remove_directory():
+    if _DIRECTORY:
+        shutil.rmtree(_DIRECTORY, ignore_errors=True)
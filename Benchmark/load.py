@@ -0,0 +1,150 @@
+from contextlib import redirect_stdout
+import numpy as np
+import argparse
+import logging
+import asyncio
+import random
+import json
+import time
+import sys
+import os
+
+# Needed to import the modules of Oscar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Benchmark import fakes, standins
+from Benchmark.benchmark import FakeBot, make_update
+from Utils import Metrics, settings
+import Oscar
+
+# Constants
+STEPS = [10, 20, 50, 100, 200] # number of simultaneous users of each step
+DURATION = 30 # in seconds, per step
+THINK_TIME = 1. # in seconds, mean time between two messages of a user
+MIX = {"weather": 0.4, "transport": 0.4, "calendar": 0.2} # share of each message in the traffic
+SATURATION_GAIN = 0.05 # throughput gain below which adding users is considered useless
+API_KEY = "AIza-load-test" # the Google Maps client only accepts keys starting with AIza
+
+
+async def user_loop(user_id: int, bot: FakeBot, deadline: float, mix: dict, think_time: float, samples: list, rng: random.Random):
+    """Simulates a user: sends a message drawn from the mix, waits for the answer, thinks, and so on until the deadline."""
+    messages, weights = list(mix), list(mix.values())
+
+    while time.perf_counter() < deadline:
+        text = rng.choices(messages, weights)[0]
+        update = make_update(rng.randrange(2**31), user_id, text, bot)
+        start = time.perf_counter()
+
+        try:
+            await Oscar.handle_input(update, None)
+            error = False
+        except Exception:
+            error = True
+
+        samples.append((text, time.perf_counter() - start, error))
+        await asyncio.sleep(rng.expovariate(1 / think_time) if think_time else 0)
+
+
+async def run_step(nb_users: int, duration: float, mix: dict, think_time: float) -> dict:
+    """Runs nb_users simultaneous users for duration seconds and summarises the answered messages."""
+    bot = FakeBot()
+    samples = []
+    # Simulated users beyond the users of the settings reuse their ids
+    nb_ids = len(settings.get_snapshot().users)
+    timeouts = {command: Metrics.get_metrics(command).timeouts for command in mix}
+    start = time.perf_counter()
+    deadline = start + duration
+
+    await asyncio.gather(*(user_loop(i % nb_ids + 1, bot, deadline, mix, think_time, samples, random.Random(i)) for i in range(nb_users)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for _, latency, _ in samples]) if samples else np.zeros(1)
+    p50, p99 = np.percentile(latencies, [50, 99])
+
+    return {
+        "users": nb_users,
+        "throughput": len(samples) / elapsed, # answered messages per second
+        "p50": float(p50),
+        "p99": float(p99),
+        "errors": sum(error for _, _, error in samples),
+        "timeouts": sum(Metrics.get_metrics(command).timeouts - timeouts[command] for command in mix),
+        "per_command": {
+            command: float(np.percentile([latency for text, latency, _ in samples if text == command] or [0], 99))
+            for command in mix
+        },
+    }
+
+
+async def run(steps: list, duration: float, mix: dict, think_time: float) -> list:
+    results = []
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for nb_users in steps:
+            result = await run_step(nb_users, duration, mix, think_time)
+            results.append(result)
+            # Progress on stderr, stdout is muted
+            print(f"{nb_users:>5} users: {result['throughput']:7.1f} msg/s | p50 {result['p50'] * 1000:7.0f}ms | p99 {result['p99'] * 1000:7.0f}ms | "
+                  f"{result['errors']} errors, {result['timeouts']} timeouts", file=sys.stderr)
+
+    return results
+
+
+def find_saturation(results: list, gain: float = SATURATION_GAIN) -> dict:
+    """Returns the first step after which adding users does not increase the throughput by more than gain."""
+    for previous, current in zip(results, results[1:]):
+        if current["throughput"] < previous["throughput"] * (1 + gain):
+            return previous
+    return results[-1]
+
+
+def parse_mix(value: str) -> dict:
+    """"weather=2,transport=1" -> {"weather": 2/3, "transport": 1/3}"""
+    mix = {}
+    for item in value.split(","):
+        command, weight = item.rsplit("=", 1)
+        mix[command.strip()] = float(weight)
+    total = sum(mix.values())
+    return {command: weight / total for command, weight in mix.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test of Oscar: simulated users against local stand-ins of the APIs.")
+    parser.add_argument("--steps", nargs="+", type=int, default=STEPS, help="simultaneous users of each step")
+    parser.add_argument("--duration", type=float, default=DURATION, help="seconds per step")
+    parser.add_argument("--think-time", type=float, default=THINK_TIME, help="mean seconds between two messages of a user, 0 for none")
+    parser.add_argument("--mix", type=parse_mix, default=MIX, help="share of each message, e.g. weather=0.4,transport=0.4,calendar=0.2")
+    parser.add_argument("--users", type=int, default=None, help="distinct users in the settings (default: largest step)")
+    parser.add_argument("--url", default=None, help="base URL of stand-ins already running (default: started in this process)")
+    parser.add_argument("--output", default=None, help="JSON file to store the results")
+    standins.add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if args.url:
+        url = args.url.rstrip("/")
+    else:
+        server = standins.serve(standins.make_config(args), port=0)
+        url = f"http://{standins.HOST}:{server.server_port}"
+
+    # SBB, Open-Meteo and Directions go through HTTP to the stand-ins, the other upstreams are faked in process
+    parameters = {
+        "URL_SBB": url + "/stationboard",
+        "URL_OPEN_METEO": url + "/v1/forecast",
+        "URL_GOOGLEMAPS": url,
+        "API_KEY_GOOGLEMAPS": API_KEY,
+        "ROUTE_SIMULATION": False, # otherwise the calendar command reads recorded routes and never calls Directions
+    }
+    fakes.install(args.users or max(args.steps), real=("sbb", "open-meteo", "directions"), parameters=parameters)
+
+    results = asyncio.run(run(args.steps, args.duration, args.mix, args.think_time))
+    saturation = find_saturation(results)
+    print(f"Saturation around {saturation['users']} users: {saturation['throughput']:.1f} msg/s, p99 {saturation['p99'] * 1000:.0f}ms")
+
+    if args.output:
+        with open(args.output, "w") as json_file:
+            json.dump({"mix": args.mix, "duration": args.duration, "think_time": args.think_time, "steps": results, "saturation": saturation}, json_file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import flatbuffers
+import threading
+import argparse
+import logging
+import random
+import struct
+import json
+import time
+import sys
+import os
+
+import openmeteo_sdk.WeatherApiResponse as WeatherApiResponse
+import openmeteo_sdk.VariablesWithTime as VariablesWithTime
+import openmeteo_sdk.VariableWithValues as VariableWithValues
+
+# Needed to import the modules of Oscar
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Benchmark import fakes
+
+# Constants
+HOST = "127.0.0.1"
+PORT = 8765
+PATHS = {
+    "/stationboard": "sbb",
+    "/v1/forecast": "open-meteo",
+    "/maps/api/directions/json": "directions",
+}
+LATENCY = {"sbb": 0.05, "open-meteo": 0.2, "directions": 0.15} # in seconds
+ERROR_RATE = {"sbb": 0., "open-meteo": 0., "directions": 0.} # fraction of requests answered with a 503
+
+logger = logging.getLogger(__name__)
+
+
+class Config:
+    """Behaviour of the stand-ins, can be changed while they are running."""
+
+    def __init__(self, latency: dict = None, error_rate: dict = None, jitter: float = 0., padding: int = 0, forecast_days: int = None):
+        self.latency = dict(LATENCY, **(latency or {}))
+        self.error_rate = dict(ERROR_RATE, **(error_rate or {}))
+        self.jitter = jitter
+        self.padding = padding # bytes added to the JSON responses
+        self.forecast_days = forecast_days # overrides the number of days requested to Open-Meteo
+        self.requests = {name: 0 for name in LATENCY}
+        self.errors = {name: 0 for name in LATENCY}
+        self.lock = threading.Lock()
+
+
+def get_list(query: dict, name: str) -> list:
+    """Values of a query parameter, repeated ("hourly=a&hourly=b") or comma-separated ("hourly=a,b")."""
+    return [value for values in query.get(name, []) for value in values.split(",") if value]
+
+
+def make_series(name: str, size: int, rng: np.random.Generator, start: int, interval: int) -> np.ndarray:
+    """Plausible values of an Open-Meteo variable."""
+    if name.startswith("precipitation") and name != "precipitation_hours":
+        return np.where(rng.random(size) < 0.2, rng.gamma(1., 1., size), 0.)
+    if name == "weather_code":
+        return rng.choice([0., 2., 3., 61., 63.], size)
+    if name == "is_day":
+        hours = (start + interval * np.arange(size)) // 3600 % 24
+        return ((hours >= 6) & (hours < 20)).astype(float)
+    if name.startswith("temperature") or name == "apparent_temperature":
+        return rng.normal(15, 5, size)
+    return rng.uniform(0, 100, size)
+
+
+def build_variables(builder: flatbuffers.Builder, names: list, start: int, count: int, interval: int, rng: np.random.Generator) -> int:
+    """Builds a VariablesWithTime table with one series per variable, in the requested order."""
+    offsets = []
+
+    for name in names:
+        values = builder.CreateNumpyVector(make_series(name, count, rng, start, interval).astype(np.float32))
+        VariableWithValues.VariableWithValuesStart(builder)
+        VariableWithValues.VariableWithValuesAddValues(builder, values)
+        offsets.append(VariableWithValues.VariableWithValuesEnd(builder))
+
+    VariablesWithTime.VariablesWithTimeStartVariablesVector(builder, len(offsets))
+    for offset in reversed(offsets):
+        builder.PrependUOffsetTRelative(offset)
+    variables = builder.EndVector()
+
+    VariablesWithTime.VariablesWithTimeStart(builder)
+    VariablesWithTime.VariablesWithTimeAddTime(builder, start)
+    VariablesWithTime.VariablesWithTimeAddTimeEnd(builder, start + count * interval)
+    VariablesWithTime.VariablesWithTimeAddInterval(builder, interval)
+    VariablesWithTime.VariablesWithTimeAddVariables(builder, variables)
+    return VariablesWithTime.VariablesWithTimeEnd(builder)
+
+
+def make_forecast(query: dict, forecast_days: int = None) -> bytes:
+    """Open-Meteo response (flatbuffers): one size-prefixed WeatherApiResponse per requested location."""
+    latitudes = [float(value) for value in get_list(query, "latitude")]
+    longitudes = [float(value) for value in get_list(query, "longitude")]
+    days = forecast_days or int(query.get("forecast_days", ["7"])[0])
+    today = int(time.time()) // 86400 * 86400
+    messages = []
+
+    for lat, lon in zip(latitudes, longitudes):
+        rng = np.random.default_rng(abs(hash((lat, lon))) % 2**32)
+        builder = flatbuffers.Builder(1024)
+        hourly = build_variables(builder, get_list(query, "hourly"), today, days * 24, 3600, rng)
+        daily = build_variables(builder, get_list(query, "daily"), today, days, 86400, rng)
+
+        WeatherApiResponse.WeatherApiResponseStart(builder)
+        WeatherApiResponse.WeatherApiResponseAddLatitude(builder, lat)
+        WeatherApiResponse.WeatherApiResponseAddLongitude(builder, lon)
+        WeatherApiResponse.WeatherApiResponseAddHourly(builder, hourly)
+        WeatherApiResponse.WeatherApiResponseAddDaily(builder, daily)
+        builder.Finish(WeatherApiResponse.WeatherApiResponseEnd(builder))
+
+        message = builder.Output()
+        messages.append(struct.pack("<i", len(message)) + message)
+
+    return b"".join(messages)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers like the SBB stationboard, Open-Meteo and Google Maps Directions APIs, after the configured latency."""
+
+    config = None # Config, set by serve
+    routes = None # recorded Directions responses, by mode
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        name = PATHS.get(url.path)
+
+        if name is None:
+            self.send_error(404)
+            return
+
+        config = self.config
+        with config.lock:
+            config.requests[name] += 1
+
+        time.sleep(max(0., config.latency[name] * (1 + random.uniform(-config.jitter, config.jitter))))
+
+        if random.random() < config.error_rate[name]:
+            with config.lock:
+                config.errors[name] += 1
+            self.send_error(503)
+            return
+
+        if name == "open-meteo":
+            self.reply(make_forecast(query, config.forecast_days), "application/octet-stream")
+            return
+
+        if name == "sbb":
+            body = fakes.make_stationboard(query.get("station", ["Lausanne"])[0], int(query.get("limit", ["5"])[0]))
+        else:
+            body = {"status": "OK", "routes": self.routes[query.get("mode", ["walking"])[0]], "geocoded_waypoints": []}
+
+        if config.padding:
+            body["padding"] = "x" * config.padding
+
+        self.reply(json.dumps(body).encode(), "application/json")
+
+    def reply(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(config: Config, host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    """Starts the stand-ins in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: the server, stop it with shutdown().
+    """
+    handler = type("Handler", (StandInHandler,), {"config": config, "routes": fakes.FakeGoogleMaps().routes})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="standins", daemon=True).start()
+    logger.info("Stand-ins listening on http://%s:%d", host, server.server_port)
+    return server
+
+
+def parse_values(values: list, names) -> dict:
+    """["sbb=0.1"] -> {"sbb": 0.1}"""
+    parsed = {}
+
+    for value in values:
+        name, number = value.rsplit("=", 1)
+        if name not in names:
+            raise argparse.ArgumentTypeError(f"Unknown upstream {name!r}, expected one of {list(names)}")
+        parsed[name] = float(number)
+
+    return parsed
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", nargs="*", default=[], metavar="UPSTREAM=SECONDS", help=f"latencies, upstreams: {', '.join(LATENCY)}")
+    parser.add_argument("--error-rate", nargs="*", default=[], metavar="UPSTREAM=FRACTION", help="fraction of requests failing with a 503")
+    parser.add_argument("--jitter", type=float, default=0., help="relative variation of the latencies, e.g. 0.2")
+    parser.add_argument("--padding", type=int, default=0, help="bytes added to the JSON responses")
+    parser.add_argument("--forecast-days", type=int, default=None, help="days of forecast returned, whatever is requested")
+
+
+def make_config(args: argparse.Namespace) -> Config:
+    return Config(parse_values(args.latency, LATENCY), parse_values(args.error_rate, ERROR_RATE), args.jitter, args.padding, args.forecast_days)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-ins of the SBB, Open-Meteo and Google Maps Directions APIs.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = serve(make_config(args), args.host, args.port)
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
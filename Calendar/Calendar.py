@@ -1,19 +1,46 @@
-from gcsa.google_calendar import GoogleCalendar
-from gcsa.event import Event
-from datetime import timedelta, datetime
-
-import pytz
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta, date, datetime
+from itertools import islice
+from typing import NamedTuple
+
+import numpy as np
+import logging
+import heapq
 import os
 import sys
-import copy
 import json
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Utils import settings
-from Route import Route
-
-CREDENTIAL_PATH = os.path.dirname(os.path.abspath(__file__)) + "/credential.json"
-TODAY = datetime.now() + timedelta(days=0)
+from Utils import settings, Clock
+from Route import Route, Geocoding, Estimator
+
+# When run as a script, 'Calendar' resolves to this file instead of the package
+if __package__:
+    from Calendar import Sync, Events
+    from Calendar.Events import EventRecord
+else:
+    import Sync
+    import Events
+    from Events import EventRecord
+
+CREDENTIAL_PATH = Sync.CREDENTIAL_PATH
+LIST_LIMIT = 20 # number of events shown by "calendar list"
+LIST_MAX = 100 # maximum number of events asked to "calendar list", e.g. "calendar list 50"
+ORS_PROFILES = {"walk": "foot-walking", "bike": "cycling-regular", "car": "driving-car"}
+ESTIMATOR_MODES = {"foot-walking": "walking", "cycling-regular": "bicycling", "driving-car": "driving"}
+ROUTE_DEADLINE = 8 # in seconds, maximum time waited for the routes of the first event
+SIMULATION_ROUTES = {
+    "walking": Route.PATH + "/Data/route_walk.json",
+    "transit": Route.PATH + "/Data/route_transit.json",
+    "driving": Route.PATH + "/Data/route_car.json",
+}
+
+logger = logging.getLogger(__name__)
+
+# Routes are computed in their own pool: travel_time already runs in a worker of Utils.Execution
+_ROUTE_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="route")
+
+_INDEXES = {} # user id -> (versions of the calendars, EventIndex)
 
 
 def get_calendars_user(user_id: str) -> dict:
@@ -25,8 +52,8 @@ def get_calendars_user(user_id: str) -> dict:
         dict: the key is the calendar id, and the value is the tine offset.
     """
     try:
-        calendars_user = settings.get_parameter(user_id)["CALENDARS"]
-    except:
+        calendars_user = settings.get_user(user_id, fallback=False).calendars
+    except KeyError:
         raise ValueError(f"User {user_id!r} could not be find in the setting file.")
 
     return calendars_user
@@ -34,11 +61,13 @@ def get_calendars_user(user_id: str) -> dict:
 def check_existence(calendar_ID: str) -> bool:
     """Make sure the requested calendar IDs (from the setting file) is indeed available."""
     
-    list_calendars_id = settings.get_parameter(calendar_ID)["CALENDARS"] # All calendar id specified by the user in the setting file
+    list_calendars_id = settings.get_user(calendar_ID, fallback=False).calendars # All calendar id specified by the user in the setting file
 
-    gc = GoogleCalendar(credentials_path=CREDENTIAL_PATH) 
+    gc, client_lock = Sync.get_client(CREDENTIAL_PATH)
+    with client_lock:
+        available = [elem.id for elem in gc.get_calendar_list()]
 
-    match = [calendar for calendar in list_calendars_id if calendar in [elem.id for elem in gc.get_calendar_list()]] # Match
+    match = [calendar for calendar in list_calendars_id if calendar in available] # Match
     fails = [calendar for calendar in list_calendars_id if calendar not in match]
 
     if (len(match) == len(list_calendars_id)) and (len(fails) == 0):
@@ -47,62 +76,202 @@ def check_existence(calendar_ID: str) -> bool:
         return False
 
 def get_all_events(calendars_user: dict, credential_path: str=CREDENTIAL_PATH):
+    """Returns the future events of each calendar of the user, read from the local store synchronised with Google (see Sync.py).
+    Events are immutable records (see Events.py): their times are already offset (some calendars, e.g. iCloud, are not
+    correctly exported) and each list is sorted by starting time. Later stages filter them without copying.
+
+    Args:
+        calendars_user (dict): from the settings. Dict: key is the calendar id; calue is the time offset.
+        credential_path (str, optional): credentials of the Google account. Defaults to CREDENTIAL_PATH.
+
+    Returns:
+        dict: key is the calendar id, value is the list of the events.
+    """
 
     all_events = {}
     
-    for calendar in list(calendars_user.keys()):
-        gc = GoogleCalendar(default_calendar=calendar, credentials_path=credential_path)
-        events = [event for event in gc]
-        all_events[calendar] = events
+    for calendar, offset in calendars_user.items():
+        all_events[calendar] = Sync.get_events(calendar, offset=offset, credential_path=credential_path)
 
     return all_events
 
-def offset_time(calendars_user: dict, calendar_events: dict) -> dict:
-    """Takes the events extracted from the calendar and adjusts the datetime as some are not correctly exported (from iCloud).
+
+def get_user_index(user_id, credential_path: str=CREDENTIAL_PATH) -> Events.EventIndex:
+    """Returns the index of all the events of the user (see Events.EventIndex). It is only rebuilt when one of the
+    calendars changed since the last call.
 
     Args:
-        calendars_user (dict): from the settings. Dict: key is the calendar id; calue is the time offset.
-        calendar_events (dict): dict. Key is the calendar id, value is the list of the events.
+        user_id (str): user id (telegram identifier)
+        credential_path (str, optional): credentials of the Google account. Defaults to CREDENTIAL_PATH.
+    """
+    calendars_user = get_calendars_user(user_id=user_id)
+    stores = {calendar: Sync.get_store(calendar) for calendar in calendars_user}
+
+    for store in stores.values():
+        store.sync(credential_path=credential_path)
+
+    versions = tuple((calendar, stores[calendar].version, offset) for calendar, offset in calendars_user.items())
+    cached = _INDEXES.get(str(user_id))
+
+    if cached and cached[0] == versions:
+        return cached[1]
+
+    index = Events.EventIndex({calendar: stores[calendar].get_records(offset) for calendar, offset in calendars_user.items()})
+    _INDEXES[str(user_id)] = (versions, index)
+
+    return index
+
+
+def is_synchronised(calendars_user: dict) -> bool:
+    """True if the local store of every calendar was downloaded at least once.
+    Otherwise, the missing stores are synchronised in the background for the next requests."""
+
+    cold = [calendar for calendar in calendars_user if not Sync.get_store(calendar).is_warm()]
+
+    for calendar in cold:
+        Sync.sync_in_background(calendar)
+
+    return not cold
+
+
+def get_first_event(user_id, day: date) -> EventRecord:
+    """Returns the first timed event (all-day events are skipped) of the user starting on the day, None if there is none.
+    Read from the local stores when synchronised, otherwise only the events of that day are downloaded."""
+
+    calendars_user = get_calendars_user(user_id=user_id)
+
+    if is_synchronised(calendars_user):
+        return get_user_index(user_id=user_id).first_event_on(day)
+
+    t0, t1 = Events.day_window(day)
+    firsts = [next((event for event in Sync.iter_window(calendar, t0, t1, offset=offset) if event.start >= t0 and not event.all_day), None) for calendar, offset in calendars_user.items()]
+    firsts = [event for event in firsts if event]
+
+    return min(firsts, key=lambda event: event.start) if firsts else None
+
+
+def get_next_events(user_id, limit: int = LIST_LIMIT) -> list:
+    """Returns the next limit events of the user, all calendars merged by starting time.
+    Read from the local stores when synchronised, otherwise streamed from the API until limit events are found."""
+
+    calendars_user = get_calendars_user(user_id=user_id)
+    now = int(Clock.now().timestamp())
+
+    if is_synchronised(calendars_user):
+        return get_user_index(user_id=user_id).events_between(now)[:limit]
+
+    streams = [(event for event in Sync.iter_window(calendar, now, offset=offset) if event.start >= now) for calendar, offset in calendars_user.items()]
+
+    return list(islice(heapq.merge(*streams, key=lambda event: event.start), limit))
+
+
+def get_events_on(user_id, day: date) -> list:
+    """Returns the events of the user starting on the day, all calendars merged by starting time."""
+
+    calendars_user = get_calendars_user(user_id=user_id)
+    t0, t1 = Events.day_window(day)
+
+    if is_synchronised(calendars_user):
+        return get_user_index(user_id=user_id).events_between(t0, t1)
+
+    streams = [(event for event in Sync.iter_window(calendar, t0, t1, offset=offset) if event.start >= t0) for calendar, offset in calendars_user.items()]
+
+    return list(heapq.merge(*streams, key=lambda event: event.start))
+
+
+def geocode_events(user_id, day: date) -> dict:
+    """Geocodes in one pass (deduplicated, cached) the locations of all the events of the user on the day.
 
     Returns:
-        dict: same object as calendar_events, but times of the events are offset.
+        dict: key is the location, value is (lat, lon) or None if it could not be found.
     """
+    events = get_events_on(user_id=user_id, day=day)
 
-    levent = copy.deepcopy(calendar_events)
+    return Geocoding.geocode_many([event.location for event in events if event.location and not event.all_day])
 
-    for calendar in levent:
-        offset = calendars_user[calendar]
-        if offset != 0:
-            for i in levent[calendar]:
-                i.start = i.start + timedelta(hours = offset)
-                i.end = i.end + timedelta(hours = offset)
 
-    return levent
+class TravelStep(NamedTuple):
+    """How to get to an event of the day."""
+    event: EventRecord
+    origin: str # "home" or the summary of the previous event
+    duration: float # travel duration in seconds, None if no route was found
+    leave_at: int # suggested departure (epoch), None if no route was found
+    feasible: bool # False if the departure is before the end of the previous event
 
 
-def get_list_events_time(calendar_events: dict) -> dict:
-    """Given a dict of calendars, returns it with events ordered by starting time."""
-    
-    for calendar in calendar_events:
-        
-        list_events_raw = copy.deepcopy(calendar_events[calendar])
+def plan_day(user_id, day: date, profile: str = "foot-walking", margin_delta = timedelta(minutes=15)) -> list:
+    """Plans the travels of the day: home to the first event, then from each event to the next one. All the
+    durations are computed with a single Openrouteservice matrix request.
 
-        # for event in calendar_events[calendar]:
-        #     # if isinstance(event.start, datetime.date):
-        #     event.start = datetime.combine(event.start, datetime.min.time())
-        list_event_ordered = sorted(list_events_raw, key=lambda event: check_type(event))
-        calendar_events[calendar] = copy.deepcopy(list_event_ordered)
+    Args:
+        user_id (str): user id (telegram identifier)
+        day (date): day to plan.
+        profile (str, optional): Openrouteservice profile. Defaults to "foot-walking".
+        margin_delta (timedelta, optional): time to arrive before each event. Defaults to 15 minutes.
 
-    return calendar_events
+    Returns:
+        list: one TravelStep per event with a location that could be geocoded.
+    """
+    # All-day events have no time to arrive at
+    events = [event for event in get_events_on(user_id=user_id, day=day) if event.location and not event.all_day]
+    coordinates = Geocoding.geocode_many([event.location for event in events])
+    events = [event for event in events if coordinates[event.location]]
+
+    if not events:
+        return []
+
+    user = settings.get_user(user_id)
+    locations = [(user.lat, user.lon)] + [coordinates[event.location] for event in events]
+    # Location i + 1 is the one of event i, location 0 is home: step i goes from location i to location i + 1
+    try:
+        durations, _ = Route.get_matrix(locations, profile=profile)
+        durations = [durations[i][i + 1] for i in range(len(events))]
+    except Exception as exp:
+        logger.warning("Openrouteservice matrix failed, using the offline estimator: %r", exp)
+        lat, lon = np.array(locations, dtype=float).T
+        durations = Estimator.estimate(lat[:-1], lon[:-1], lat[1:], lon[1:], mode=ESTIMATOR_MODES[profile])[1].tolist()
+
+    margin = int(margin_delta.total_seconds())
+    plan = []
+
+    for i, event in enumerate(events):
+        duration = durations[i]
+        leave_at = int(event.start - margin - duration) if duration is not None else None
+        feasible = i == 0 or leave_at is None or leave_at >= events[i - 1].end
+        plan.append(TravelStep(event=event, origin="home" if i == 0 else events[i - 1].summary, duration=duration, leave_at=leave_at, feasible=feasible))
+
+    return plan
 
-def check_type(event: Event):
-    
-    if not isinstance(event.start, datetime):
-        event.start = datetime.combine(event.start, datetime.min.time())
-        event.start = pytz.utc.localize(event.start)
-        event.start = event.start.astimezone(pytz.utc)
 
-    return event.start
+def export_day_plan(user_id, mode: str = "walk", days_forward: int = 1) -> str:
+    """Describes when to leave for each event of the day (tomorrow by default) and flags the impossible transfers.
+
+    Args:
+        user_id (str): user id (telegram identifier)
+        mode (str, optional): key of ORS_PROFILES. Defaults to "walk".
+        days_forward (int, optional): number of day after today. Defaults to 1 (tomorrow).
+    """
+    plan = plan_day(user_id=user_id, day=Clock.today() + timedelta(days=days_forward), profile=ORS_PROFILES.get(mode, ORS_PROFILES["walk"]))
+
+    if not plan:
+        return "🗺️ No event with a location tomorrow."
+
+    out = [f"🗺️ Your day tomorrow ({mode}):"]
+
+    for i, step in enumerate(plan):
+        line = f" - {step.event.start_time.strftime('%H:%M')} {step.event.summary}: "
+
+        if step.leave_at is None:
+            line += f"no route found from {step.origin}."
+        else:
+            line += f"leave {step.origin} at {datetime.fromtimestamp(step.leave_at, tz=Clock.get_timezone()).strftime('%H:%M')} ({int(step.duration // 60)}min)."
+
+        if not step.feasible:
+            line += f" ⚠️ Not possible: {step.origin} ends at {plan[i - 1].event.end_time.strftime('%H:%M')}."
+
+        out.append(line)
+
+    return "\n".join(out)
 
 
 def get_events_tomorrow(calendar_events: dict, days_forward: int= 1) -> dict:    
@@ -113,71 +282,90 @@ def get_events_tomorrow(calendar_events: dict, days_forward: int= 1) -> dict:
         days_forward (int, optional): number of day after today to select the events from. Defaults to 1 (tomorrow).
 
     Returns:
-        dict: dict. Key is the calendar id, value is the list of the events.
+        dict: dict. Key is the calendar id, value is the list of the events (sorted by starting time).
     """
     calendar_events_tomorrow = {}
+    t0, t1 = Events.day_window(Clock.today() + timedelta(days=days_forward))
 
     for cal in calendar_events:
-        tomorrow = [copy.deepcopy(event) for event in calendar_events[cal] if event.start.day == (TODAY + timedelta(days=days_forward)).day]
-        calendar_events_tomorrow[cal] = copy.deepcopy(tomorrow)
+        calendar_events_tomorrow[cal] = Events.events_between(calendar_events[cal], t0, t1)
 
     return calendar_events_tomorrow
 
 
-def get_first_event_day(calendar_events_tomorrow: dict) -> Event:
-    """From a dictionnary of all the events of a specific day, it returns the first event of the day.
+def get_first_event_day(calendar_events_tomorrow: dict) -> EventRecord:
+    """From a dictionnary of all the events of a specific day, it returns the first timed event of the day (all-day events are skipped).
 
     Args:
-        calendar_events_tomorrow (dict): dict. Key is the calendar id, value is the list of the events.
+        calendar_events_tomorrow (dict): dict. Key is the calendar id, value is the list of the events, sorted by starting time.
 
     Returns:
-        Event: first event of the day. Returns None if no event on specified day.
+        EventRecord: first event of the day. Returns None if no event on specified day.
     """
 
-    list_min = []
-    
-    for cal in calendar_events_tomorrow:
-        try:
-            first_event = min(calendar_events_tomorrow[cal], key = lambda event: event.start)
-            list_min.append(copy.deepcopy(first_event))
-        except:
-            continue
+    list_min = [next((event for event in events if not event.all_day), None) for events in calendar_events_tomorrow.values()]
+    list_min = [event for event in list_min if event]
 
     if len(list_min) == 0:
         return None
     else:
-        first = min(list_min, key = lambda event: event.start)
-        return first
+        return min(list_min, key = lambda event: event.start)
 
 
-def check_address(event: Event):
+def check_address(event: EventRecord):
     """Check if the event has an address associated.
 
     Args:
-        event (Event): event.
+        event (EventRecord): event.
 
     Returns:
         str or bool: if the event has an address, it returns the address, otherwise it return False. 
     """
-    try:
-        address = event.location
+    return event.location or False
+
+def compute_route(mode: str, lat_user: float, lon_user: float, lat_event: float, lon_event: float, arrival_time: datetime, simulation: bool = False) -> str:
+    """Computes the route of one mode and returns its summary string.
+
+    Args:
+        mode (str): one of Route.GMAPS_MODES, or "openrouteservice" (walking route from openrouteservice).
+        simulation (bool, optional): if True, the route is read from the recorded responses in Route/Data. Defaults to False.
+
+    Returns:
+        str: summary of the route.
+    """
+    if mode == "openrouteservice":
+        route = Route.get_route(lat_user, lon_user, lat_event, lon_event)
+        return Route.string_openrouteservice(route) + "\n"
+
+    if simulation:
+        with open(SIMULATION_ROUTES[mode], "r") as json_file:
+            route = json.load(json_file)
+    else:
+        route = Route.get_route_gmaps(lat_user, lon_user, lat_event, lon_event, arrival_time=arrival_time, transit=mode)
 
-    except:
-        address = False
+    return Route.export_string_route(route) + "\n"
 
-    return address
 
 #TODO: create a fancy string to inform user before they go to bed
-def travel_time(event: Event, user_id, walk = True, transit = True, car = False, margin_delta = timedelta(minutes=15), simulation = False):
+def travel_time(event: EventRecord, user_id, walk = True, transit = True, car = False, bicycle = False, openrouteservice = False, margin_delta = timedelta(minutes=15), simulation = False, deadline = ROUTE_DEADLINE, on_late = None, on_estimate = None):
+    """Describes the first event and how to get there. The routes of all the requested modes are computed concurrently:
+    the answer waits at most `deadline` seconds, modes finishing later are dropped or, if `on_late` is given, passed
+    to on_late(summary) as soon as they are ready (e.g. to send a follow-up message).
+    An offline estimate of the travel time (see Route/Estimator.py) is passed to on_estimate(summary) before any
+    route is requested; without on_estimate, it replaces the routes if none of them is ready in time.
+    """
+
+    if event is None:
+        return "📆 You have no event tomorrow."
 
-    time_event = event.start
+    time_event = event.start_time
     # TODO: add the margin delta of each user in the settings file
     arrival_time_event = time_event - margin_delta
 
     output = []
 
     event_name = event.summary if event.summary else "Unnamed Event"
-    start_time = event.start.strftime('%H:%M') if event.start else "No start time"
+    start_time = event.start_time.strftime('%H:%M')
 
     out1 = f"📆 Your first event tomorrow is {event_name} and starts at {start_time}."
     output.append(out1)
@@ -188,38 +376,36 @@ def travel_time(event: Event, user_id, walk = True, transit = True, car = False,
         output.append(out2)
         lat_event, lon_event = Route.address_to_coordinates(loc_event)
         
-        # TODO: trouver un moyen de récupérer le user ID
-        try:
-            loc_user = settings.get_parameter(user_id)["COORDINATES"]
-        except:
-            user_id = settings.get_parameter("ID_MAIN")
-            loc_user = settings.get_parameter(user_id)["COORDINATES"]
-
-        lat_user, lon_user = loc_user["LAT"], loc_user["LON"]
-
-        # 1. Get the string that summmarizes the walk route
-        if walk:
-            # route_walk = Route.get_route(lat_user, lon_user, lat_event, lon_event)
-            # distance_walk, duration_walk = Route.get_time_distance_openrouteservice(route_walk)
-            if simulation:
-                path = "Route/Data/route_walk.json"
-                with open(path, "r") as json_file:
-                    route_walk = json.load(json_file)
-            else:
-                route_walk = Route.get_route_gmaps(lat_user, lon_user, lat_event, lon_event, arrival_time=arrival_time_event, transit="walking")
-            summary_walk = Route.export_string_route(route_walk) + "\n"
-            output.append(summary_walk)
-
-        # 2. Get the string that summmarizes the transit route
-        if transit:
-            if simulation:
-                path = "Route/Data/route_transit.json"
-                with open(path, "r") as json_file:
-                    route_transit = json.load(json_file)
+        user = settings.get_user(user_id)
+        lat_user, lon_user = user.lat, user.lon
+
+        estimate = Estimator.string_estimate(lat_user, lon_user, lat_event, lon_event)
+        if on_estimate:
+            on_estimate(estimate)
+
+        requested = {"walking": walk, "transit": transit, "driving": car, "bicycling": bicycle, "openrouteservice": openrouteservice}
+        # Recorded responses only exist for some modes
+        modes = [mode for mode, wanted in requested.items() if wanted and (not simulation or mode in SIMULATION_ROUTES)]
+
+        # Fan out all the modes: the latency is the one of the slowest mode within the deadline, not their sum
+        futures = {mode: _ROUTE_POOL.submit(compute_route, mode, lat_user, lon_user, lat_event, lon_event, arrival_time_event, simulation) for mode in modes}
+        wait(futures.values(), timeout=deadline)
+
+        for mode, future in futures.items():
+            if not future.done():
+                logger.info("The %s route missed the %ss deadline", mode, deadline)
+                if on_late:
+                    future.add_done_callback(lambda future, mode=mode: on_late(future.result()) if not future.exception() else None)
+                else:
+                    future.cancel()
+            elif future.exception():
+                logger.warning("The %s route could not be computed: %r", mode, future.exception())
             else:
-                route_transit = Route.get_route_gmaps(lat_user, lon_user, lat_event, lon_event, arrival_time=arrival_time_event, transit="transit")
-            summary_transit = Route.export_string_route(route_transit) + "\n"
-            output.append(summary_transit)
+                output.append(future.result())
+
+        # No route is ready: the estimate is the best answer available (unless it was already sent)
+        if modes and not on_estimate and not any(future.done() and not future.exception() for future in futures.values()):
+            output.append(estimate + "\n")
 
     else:
         output.append("No location was specified for the event.")
@@ -228,31 +414,26 @@ def travel_time(event: Event, user_id, walk = True, transit = True, car = False,
 
     return output_full
 
-def export_first_event_tomorrow(user_id, simulation = True):
+def export_first_event_tomorrow(user_id, simulation = True, on_late = None, on_estimate = None):
 
-    calendars_user = get_calendars_user(user_id=user_id)
-    events_user = get_all_events(calendars_user=calendars_user)
-    calendar_events_offset = offset_time(calendars_user = calendars_user, calendar_events= events_user)
-    calendar_tomorrow = get_events_tomorrow(calendar_events= calendar_events_offset)
-    first_event_tomorrow = get_first_event_day(calendar_tomorrow)
+    first_event_tomorrow = get_first_event(user_id=user_id, day=Clock.today() + timedelta(days=1))
 
-    string = travel_time(first_event_tomorrow, user_id=user_id, simulation = simulation)
+    string = travel_time(first_event_tomorrow, user_id=user_id, simulation = simulation, on_late = on_late, on_estimate = on_estimate)
 
     return string
 
-def export_all_events(user_id, simulation = True):
+def export_all_events(user_id, simulation = True, limit = LIST_LIMIT):
 
-    calendars_user = get_calendars_user(user_id=user_id)
-    events_user = get_all_events(calendars_user=calendars_user)
-    calendar_events_offset = offset_time(calendars_user = calendars_user, calendar_events= events_user)
-    ordered_events = get_list_events_time(calendar_events_offset)
-    
-    out = ["📆 All the future events found are: "]
-    for calendar in ordered_events:
-        for elem in ordered_events[calendar]:
-            start_time = elem.start.strftime(' - %a %d %b, %Y at %H:%M \t\t') if elem.start else "No start time"
-            app = start_time + elem.summary
-            out.append(app)
+    events = get_next_events(user_id=user_id, limit=limit)
+
+    if not events:
+        return "📆 You have no upcoming event."
+
+    out = [f"📆 The next {len(events)} events found are: "]
+    for elem in events:
+        start_time = elem.start_time.strftime(' - %a %d %b, %Y all day \t\t' if elem.all_day else ' - %a %d %b, %Y at %H:%M \t\t')
+        app = start_time + elem.summary
+        out.append(app)
 
     output = "\n".join(out)
 
@@ -271,22 +452,14 @@ if __name__ == "__main__":
     events_user = get_all_events(calendars_user=calendars_user)
     print(events_user, "", sep = "\n")
 
-    # 3. Offsetting the time of the events: same format as events_user but the events from the calendar needing offset are changed
-    calendar_events_offset = offset_time(calendars_user = calendars_user, calendar_events= events_user)
-    # print(calendar_events_offset, "", sep = "\n")
-
-    # 4. Order the events by starting time
-    ordered_events = get_list_events_time(calendar_events_offset)
-    # print(ordered_events, "", sep = "\n")
-
-    # 5. Filter to keep only the events of tomorrow
-    calendar_tomorrow = get_events_tomorrow(calendar_events= calendar_events_offset)
+    # 3. Filter to keep only the events of tomorrow (events are already offset and ordered by starting time)
+    calendar_tomorrow = get_events_tomorrow(calendar_events= events_user)
     # print(calendar_tomorrow, "", sep = "\n")
 
-    # 5.2 Or the event 2 days ahead
-    calendar_later = get_events_tomorrow(calendar_events= calendar_events_offset, days_forward=2)
+    # 3.2 Or the event 2 days ahead
+    calendar_later = get_events_tomorrow(calendar_events= events_user, days_forward=2)
     # print(calendar_later, "", sep = "\n")
 
-    # 6. Get the first element of tomorrow
+    # 4. Get the first element of tomorrow
     first_event_tomorrow = get_first_event_day(calendar_tomorrow)
     print(first_event_tomorrow, "", sep = "\n")
\ No newline at end of file
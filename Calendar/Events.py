@@ -0,0 +1,104 @@
+from datetime import datetime, date, time, timedelta, tzinfo
+from typing import NamedTuple
+import bisect
+import heapq
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils import Clock
+
+
+class EventRecord(NamedTuple):
+    """Compact immutable calendar event. Times are epochs (in seconds), already offset for the calendar."""
+    start: int
+    end: int
+    summary: str
+    location: str
+    calendar_id: str
+    all_day: bool
+
+    @property
+    def start_time(self) -> datetime:
+        """Start in the configured timezone (see Clock.get_timezone)."""
+        return datetime.fromtimestamp(self.start, tz=Clock.get_timezone())
+
+    @property
+    def end_time(self) -> datetime:
+        """End in the configured timezone (see Clock.get_timezone)."""
+        return datetime.fromtimestamp(self.end, tz=Clock.get_timezone())
+
+
+def to_epoch(time: dict) -> int:
+    """Converts the start or end of a raw event to an epoch. All-day events start at midnight in the configured
+    timezone (see Clock.get_timezone), so that they fall in the day windows of their date."""
+
+    if "dateTime" in time:
+        return int(datetime.fromisoformat(time["dateTime"]).timestamp())
+
+    return int(datetime.fromisoformat(time["date"]).replace(tzinfo=Clock.get_timezone()).timestamp())
+
+
+def from_item(item: dict, calendar_id: str, offset: float = 0) -> EventRecord:
+    """Builds the record of a raw event (as returned by the API), shifting its times by offset hours.
+    Some calendars (e.g. iCloud) are not exported with the right time. All-day events have no time and are not shifted."""
+
+    all_day = "date" in item["start"]
+    shift = 0 if all_day else int(offset * 3600)
+
+    return EventRecord(
+        start=to_epoch(item["start"]) + shift,
+        end=to_epoch(item["end"]) + shift,
+        summary=item.get("summary") or "Unnamed Event",
+        location=item.get("location"),
+        calendar_id=calendar_id,
+        all_day=all_day,
+    )
+
+
+def day_window(day: date, tz: tzinfo = None) -> tuple:
+    """Returns the epochs (start, end) of a day, from midnight to midnight in the timezone (the configured one if None)."""
+    start = datetime.combine(day, time.min, tzinfo=tz or Clock.get_timezone())
+    return int(start.timestamp()), int((start + timedelta(days=1)).timestamp())
+
+
+def events_between(events: list, t0: int, t1: int) -> list:
+    """Returns the events of a list sorted by start that start in [t0, t1), by bisection."""
+    key = lambda event: event.start
+    return events[bisect.bisect_left(events, t0, key=key):bisect.bisect_left(events, t1, key=key)]
+
+
+class EventIndex:
+    """Events of all the calendars of a user, merged and sorted by start, answering time-window queries by bisection."""
+
+    def __init__(self, calendars: dict):
+        """
+        Args:
+            calendars (dict): key is the calendar id, value is the list of its events sorted by start.
+        """
+        self.calendars = calendars
+        # k-way merge of the sorted calendars: O(n log k)
+        self.events = list(heapq.merge(*calendars.values(), key=lambda event: event.start))
+        self.starts = [event.start for event in self.events]
+
+    def __len__(self):
+        return len(self.events)
+
+    def events_between(self, t0: int, t1: int = None) -> list:
+        """Returns the events starting in [t0, t1) (t1 = None: no upper bound), in O(log n + k)."""
+        i = bisect.bisect_left(self.starts, t0)
+        j = len(self.starts) if t1 is None else bisect.bisect_left(self.starts, t1)
+        return self.events[i:j]
+
+    def first_event_on(self, day: date, tz: tzinfo = None) -> EventRecord:
+        """Returns the first timed event starting on the day (in the timezone, the configured one if None), None if there
+        is none. All-day events are skipped: they have no time to be at."""
+        t0, t1 = day_window(day, tz)
+        i = bisect.bisect_left(self.starts, t0)
+
+        while i < len(self.events) and self.events[i].start < t1:
+            if not self.events[i].all_day:
+                return self.events[i]
+            i += 1
+
+        return None
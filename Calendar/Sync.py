@@ -0,0 +1,239 @@
+from gcsa.google_calendar import GoogleCalendar
+from googleapiclient.errors import HttpError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import threading
+import hashlib
+import logging
+import json
+import time
+import os
+
+# When run as a script, 'Calendar' resolves to Calendar.py instead of the package
+if __package__:
+    from Calendar import Events
+else:
+    import Events
+
+logger = logging.getLogger(__name__)
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+CREDENTIAL_PATH = PATH + "/credential.json"
+PATH_STORE = PATH + "/Data"
+SYNC_INTERVAL = 60 # in seconds, minimum time between two synchronisations of a calendar
+PAGE_SIZE = 2500 # max events per page allowed by the API
+WINDOW_PAGE_SIZE = 50 # events per page when streaming a time window
+# Field masks: only download what Events.from_item reads
+FIELDS_EVENT = "id,status,summary,location,start,end"
+FIELDS_SYNC = f"items({FIELDS_EVENT}),nextPageToken,nextSyncToken"
+FIELDS_WINDOW = f"items({FIELDS_EVENT}),nextPageToken"
+
+_LOCK = threading.Lock()
+_CLIENTS = {} # credential path -> (GoogleCalendar, lock serialising its requests)
+_STORES = {} # calendar id -> CalendarStore
+_BACKGROUND = ThreadPoolExecutor(max_workers=2, thread_name_prefix="calendar-sync")
+_PENDING = set() # calendar ids being synchronised in the background
+
+
+def get_client(credential_path: str = CREDENTIAL_PATH) -> tuple:
+    """Returns the authorized client of a credential, created once. The underlying http client is not thread-safe:
+    requests must be made while holding the returned lock.
+
+    Returns:
+        tuple: (GoogleCalendar, threading.Lock)
+    """
+    with _LOCK:
+        if credential_path not in _CLIENTS:
+            _CLIENTS[credential_path] = (GoogleCalendar(credentials_path=credential_path), threading.Lock())
+        return _CLIENTS[credential_path]
+
+
+class CalendarStore:
+    """Local copy of the events of a calendar, persisted on disk and kept up to date with Google's incremental sync."""
+
+    def __init__(self, calendar_id: str):
+        self.calendar_id = calendar_id
+        self.path = f"{PATH_STORE}/{hashlib.sha1(calendar_id.encode()).hexdigest()}.json"
+        self.sync_token = None
+        self.events = {} # event id -> raw event (as returned by the API)
+        self.last_sync = 0.
+        self.version = 0 # incremented at each change of the events
+        self._records = {} # offset -> (version, records sorted by start)
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.sync_token, self.events = data["sync_token"], data["events"]
+
+    def save(self):
+        os.makedirs(PATH_STORE, exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump({"calendar_id": self.calendar_id, "sync_token": self.sync_token, "events": self.events}, f)
+        os.replace(self.path + ".tmp", self.path)
+
+    def sync(self, credential_path: str = CREDENTIAL_PATH, force: bool = False):
+        """Downloads the events changed since the last synchronisation (all the events the first time).
+
+        Args:
+            credential_path (str, optional): credentials of the Google account. Defaults to CREDENTIAL_PATH.
+            force (bool, optional): if True, ignores SYNC_INTERVAL. Defaults to False.
+        """
+        with self.lock:
+            if not force and time.time() - self.last_sync < SYNC_INTERVAL:
+                return
+
+            gc, client_lock = get_client(credential_path)
+
+            try:
+                with client_lock:
+                    changes, sync_token = self._list_changes(gc, self.sync_token)
+
+            except HttpError as exp:
+                # The sync token expired: the whole calendar needs to be downloaded again
+                if exp.resp.status != 410:
+                    raise
+                logger.info("Sync token of %r expired, full synchronisation", self.calendar_id)
+                self.events = {}
+                self.version += 1
+                with client_lock:
+                    changes, sync_token = self._list_changes(gc, None)
+
+            for item in changes:
+                if item.get("status") == "cancelled":
+                    self.events.pop(item["id"], None)
+                else:
+                    self.events[item["id"]] = item
+
+            changed = bool(changes) or sync_token != self.sync_token
+            self.sync_token = sync_token
+            self.last_sync = time.time()
+
+            if changes:
+                self.version += 1
+            if changed:
+                self.save()
+
+    def _list_changes(self, gc: GoogleCalendar, sync_token: str) -> tuple:
+        """Lists all the pages of events changed since the sync token.
+
+        Returns:
+            tuple: (list of raw events, next sync token)
+        """
+        changes, page_token = [], None
+
+        while True:
+            response = gc.service.events().list(
+                calendarId=self.calendar_id,
+                singleEvents=True,
+                maxResults=PAGE_SIZE,
+                syncToken=sync_token,
+                pageToken=page_token,
+                fields=FIELDS_SYNC,
+            ).execute()
+
+            changes.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+
+            if not page_token:
+                return changes, response.get("nextSyncToken")
+
+    def is_warm(self) -> bool:
+        """True if the store was fully downloaded at least once."""
+        return self.sync_token is not None
+
+    def get_records(self, offset: float = 0) -> tuple:
+        """Returns the stored events as records (see Events.py) shifted by offset hours and sorted by start.
+        Records are built once per version of the store and shared by all the readers: they must not be modified."""
+
+        with self.lock:
+            cached = self._records.get(offset)
+            if cached and cached[0] == self.version:
+                return cached[1]
+
+            records = tuple(sorted((Events.from_item(item, self.calendar_id, offset) for item in self.events.values()), key=lambda record: record.start))
+            self._records[offset] = (self.version, records)
+
+        return records
+
+
+def get_store(calendar_id: str) -> CalendarStore:
+    with _LOCK:
+        if calendar_id not in _STORES:
+            _STORES[calendar_id] = CalendarStore(calendar_id)
+        return _STORES[calendar_id]
+
+
+def get_events(calendar_id: str, offset: float = 0, credential_path: str = CREDENTIAL_PATH) -> list:
+    """Synchronises the calendar (if not done in the last SYNC_INTERVAL seconds) and returns its future events
+    (records shifted by offset hours, sorted by start) from the local store."""
+    store = get_store(calendar_id)
+    store.sync(credential_path=credential_path)
+    now = time.time()
+    return [record for record in store.get_records(offset) if record.end >= now]
+
+
+def sync_in_background(calendar_id: str, credential_path: str = CREDENTIAL_PATH):
+    """Starts the synchronisation of a calendar in the background, unless it is already running."""
+
+    with _LOCK:
+        if calendar_id in _PENDING:
+            return
+        _PENDING.add(calendar_id)
+
+    def run():
+        try:
+            get_store(calendar_id).sync(credential_path=credential_path)
+        except Exception:
+            logger.exception("Background synchronisation of %r failed", calendar_id)
+        finally:
+            with _LOCK:
+                _PENDING.discard(calendar_id)
+
+    _BACKGROUND.submit(run)
+
+
+def iter_window(calendar_id: str, t0: int, t1: int = None, offset: float = 0, credential_path: str = CREDENTIAL_PATH, page_size: int = WINDOW_PAGE_SIZE):
+    """Streams from the API, page by page and sorted by start, the events of a calendar overlapping [t0, t1).
+    Pages are only requested when the previous one is consumed: stop iterating to stop downloading.
+
+    Args:
+        calendar_id (str): calendar id.
+        t0 (int): start of the window (epoch, after offset).
+        t1 (int, optional): end of the window (epoch, after offset). Defaults to None (no end).
+        offset (float, optional): time offset of the calendar, in hours. Defaults to 0.
+        credential_path (str, optional): credentials of the Google account. Defaults to CREDENTIAL_PATH.
+        page_size (int, optional): number of events per page. Defaults to WINDOW_PAGE_SIZE.
+
+    Yields:
+        EventRecord: events shifted by offset hours.
+    """
+    gc, client_lock = get_client(credential_path)
+    shift = int(offset * 3600)
+    to_rfc3339 = lambda epoch: datetime.fromtimestamp(epoch - shift, timezone.utc).isoformat()
+    page_token = None
+
+    while True:
+        with client_lock:
+            response = gc.service.events().list(
+                calendarId=calendar_id,
+                timeMin=to_rfc3339(t0),
+                timeMax=to_rfc3339(t1) if t1 is not None else None,
+                singleEvents=True,
+                orderBy="startTime",
+                maxResults=page_size,
+                pageToken=page_token,
+                fields=FIELDS_WINDOW,
+            ).execute()
+
+        for item in response.get("items", []):
+            if item.get("status") != "cancelled":
+                yield Events.from_item(item, calendar_id, offset)
+
+        page_token = response.get("nextPageToken")
+
+        if not page_token:
+            return
@@ -1,11 +1,16 @@
-from Utils.settings import get_parameter
+from Utils.settings import get_parameter, get_user
 from Utils.Communications import print_input, give_time, start, help_command
-from Weather.Weather import summarize, string_to_export
+from Weather.Weather import get_summary, precompute_summaries, string_to_export
 from Transport.SBB import export_string_sbb
-from Calendar.Calendar import export_first_event_tomorrow, export_all_events
-from Utils import settings
+from Calendar.Calendar import export_first_event_tomorrow, export_all_events, export_day_plan, geocode_events, LIST_LIMIT, LIST_MAX, ORS_PROFILES
+from Route import Directions, Estimator, Places
+from Utils.Execution import run_blocking, shutdown
+from Utils import settings, Metrics, Clock
+from Utils import Commands as commands
 
+import datetime
 import logging
+import asyncio
 import os
 from telegram import Update
 from telegram.ext import Application, MessageHandler, CommandHandler, filters, ContextTypes
@@ -16,44 +21,140 @@ logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
+# Time (UTC) at which the weather summaries of the day are computed
+SUMMARY_TIME = datetime.time(hour=5, minute=30)
+SUMMARY_TIMEOUT = 300 # in seconds
+# Time (UTC) at which the locations of tomorrow's events are geocoded
+LOCATIONS_TIME = datetime.time(hour=17)
+LOCATIONS_TIMEOUT = 600 # in seconds
+PLACES_TIMEOUT = 600 # in seconds, the first load geocodes every scraped address
+PLACES_INTERVAL = 3600 # in seconds, time between two checks of the scraped places
+ROUTES_CLEANUP_INTERVAL = 3600 # in seconds, time between two purges of the expired cached routes
+# Time (UTC) at which the travel time estimator is calibrated again on the cached routes
+CALIBRATION_TIME = datetime.time(hour=3)
+
 async def handle_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Master function to manage user input via Telegram."""
 
     print_input(update=update)
 
-    if update.message.text.lower() == "time":
-        await update.message.reply_text(f"The time is {give_time(full=True)}.")
+    await commands.dispatch(update, context)
+
+
+@commands.register("time", description="Current date and time")
+async def time_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    await update.message.reply_text(f"The time is {give_time(full=True)}.")
+
+
+@commands.register("wsh")
+async def wsh_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    await update.message.reply_text(f"Hello ma poule")
+
+
+@commands.register("weather", "meteo", description="Weather summary of the day")
+async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    id_ = update.message.from_user.id
+    weather_code, min_temp, max_temp, precip, precip_total = await run_blocking(get_summary, command="weather", id_user=id_)
+    await update.message.reply_text(string_to_export(weather_code, min_temp, max_temp, precip, precip_total))
+
+
+@commands.register("transport", "sbb", description="Next departures from the closest stop")
+async def transport_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    station = get_user(update.message.from_user.id).stop
+    schedule_message = await run_blocking(export_string_sbb, command="transport", station=station, limit=6)
+    await update.message.reply_text(schedule_message)
+
+
+@commands.register("calendar", description="First event of tomorrow and how to get there")
+async def calendar_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    id = update.message.from_user.id
+    loop = asyncio.get_running_loop()
+
+    # The offline estimate is sent right away, routes missing the deadline in a follow-up message
+    def reply_from_worker(summary: str):
+        asyncio.run_coroutine_threadsafe(update.message.reply_text(summary), loop)
+
+    # Routes are read from the recorded responses of Route/Data unless "ROUTE_SIMULATION" is false in the settings
+    simulation = settings.get_snapshot().data.get("ROUTE_SIMULATION", True)
+    calendar = await run_blocking(export_first_event_tomorrow, command="calendar", user_id=id, simulation=simulation, on_late=reply_from_worker, on_estimate=reply_from_worker)
+    await update.message.reply_text(calendar)
+
+
+@commands.register("calendar list", "calendar all", description="Upcoming events")
+async def calendar_list_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    id = update.message.from_user.id
+    # "calendar list 10": number of events to show, between 1 and LIST_MAX
+    limit = min(max(int(args[0]), 1), LIST_MAX) if args and args[0].isdigit() else LIST_LIMIT
+    calendar = await run_blocking(export_all_events, command="calendar list", user_id=id, simulation=True, limit=limit)
+    await update.message.reply_text(calendar)
+
+
+@commands.register("plan", "calendar plan", description="When to leave for each event of tomorrow")
+async def plan_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    id = update.message.from_user.id
+    # "plan bike": travel mode, see ORS_PROFILES
+    mode = args[0] if args and args[0] in ORS_PROFILES else "walk"
+    plan = await run_blocking(export_day_plan, command="plan", user_id=id, mode=mode)
+    await update.message.reply_text(plan)
+
+
+@commands.register("near", "nearest", description="Closest scraped places of a category, e.g. \"near school 3\"")
+async def near_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    user = get_user(update.message.from_user.id)
+    # "near school 3": category, then optional number of places
+    n = int(args.pop()) if args and args[-1].isdigit() else Places.NEAREST
+
+    if not args:
+        await update.message.reply_text("📍 Which places? e.g. \"near school\".")
+        return
 
-    if update.message.text.lower() == "wsh":
-        await update.message.reply_text(f"Hello ma poule")
+    places = await run_blocking(Places.string_nearest, " ".join(args), user.lat, user.lon, n, command="near")
+    await update.message.reply_text(places)
 
-    if update.message.text.lower() == "weather":
-        id_ = update.message.from_user.id
-        weather_code, min_temp, max_temp, precip, precip_total = summarize(id_user=update.message.from_user.id)
-        await update.message.reply_text(string_to_export(weather_code, min_temp, max_temp, precip, precip_total))
 
-    if update.message.text.lower() == "transport":
-        id = update.message.from_user.id
-        try:
-            station = get_parameter(id)["STOP"]
-            schedule_message = export_string_sbb(station=get_parameter(id)["STOP"], limit=6)
-            
-        except:
-            schedule_message = export_string_sbb(station=get_parameter("STOP_MAIN"), limit=6)
+@commands.register("stats", description="Latency of each command")
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE, args: list):
+    lines = [metrics.summary() for metrics in Metrics.all_metrics()]
+    directions = Directions.get_stats()
+    lines.append(f"directions cache: {directions['hits']} hits, {directions['misses']} misses")
+    await update.message.reply_text("📊 Commands latency:\n" + "\n".join(lines))
 
-        await update.message.reply_text(schedule_message)
 
-    if update.message.text.lower() == "calendar":
-        id = update.message.from_user.id
-        calendar = export_first_event_tomorrow(user_id = id, simulation=True)
-        await update.message.reply_text(calendar)
+async def precompute_weather(context: ContextTypes.DEFAULT_TYPE):
+    """Job computing the weather summary of the day of every user, so that the weather command answers from memory."""
 
-    if update.message.text.lower() == "calendar list":
-        id = update.message.from_user.id
-        calendar = export_all_events(user_id = id, simulation=True)
-        await update.message.reply_text(calendar)
+    id_users = list(settings.get_snapshot().users)
+    await run_blocking(precompute_summaries, id_users, command="precompute weather", timeout=SUMMARY_TIMEOUT)
+    logger.info("Weather summaries computed for %d users", len(id_users))
+
+
+async def prefetch_locations(context: ContextTypes.DEFAULT_TYPE):
+    """Job geocoding the locations of tomorrow's events of every user, so that the calendar command does not wait on Nominatim."""
+
+    tomorrow = Clock.today() + datetime.timedelta(days=1)
+
+    for id_user, user in settings.get_snapshot().users.items():
+        if user.calendars:
+            await run_blocking(geocode_events, id_user, tomorrow, command="prefetch locations", timeout=LOCATIONS_TIMEOUT)
+
+
+async def load_places(context: ContextTypes.DEFAULT_TYPE):
+    """Job loading the scraped places (again, if the scraper wrote new records), so that the near command answers from memory."""
+
+    await run_blocking(Places.reload, command="load places", timeout=PLACES_TIMEOUT)
+
+
+async def clear_routes(context: ContextTypes.DEFAULT_TYPE):
+    """Job dropping the expired routes from the Directions cache, in memory and on disk."""
+
+    await run_blocking(Directions.clear_expired, command="clear routes")
+
+
+async def recalibrate_estimator(context: ContextTypes.DEFAULT_TYPE):
+    """Job fitting the offline travel time estimator again, on the Directions responses cached since the last fit."""
+
+    await run_blocking(Estimator.recalibrate, command="recalibrate estimator")
 
-        
 
 def main() -> None:
     """Start the bot."""
@@ -66,7 +167,8 @@ def main() -> None:
 
 
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(get_parameter("BOT_TOKEN")).build()
+    # Updates are processed concurrently so that a slow command does not hold back the other users
+    application = Application.builder().token(get_parameter("BOT_TOKEN")).concurrent_updates(True).build()
 
 
     # # on different commands - answer in Telegram
@@ -75,9 +177,28 @@ def main() -> None:
 
     application.add_handler(MessageHandler(filters.TEXT, handle_input))
 
+    # Compute the weather summaries every morning, and once at startup
+    application.job_queue.run_daily(precompute_weather, time=SUMMARY_TIME)
+    application.job_queue.run_once(precompute_weather, when=0)
+
+    # Geocode the locations of tomorrow's events every evening
+    application.job_queue.run_daily(prefetch_locations, time=LOCATIONS_TIME)
+
+    # Geocode and index the scraped places at startup, then pick up new scraping runs every hour
+    application.job_queue.run_repeating(load_places, interval=PLACES_INTERVAL, first=0)
+
+    # Purge the expired routes every hour
+    application.job_queue.run_repeating(clear_routes, interval=ROUTES_CLEANUP_INTERVAL, first=ROUTES_CLEANUP_INTERVAL)
+
+    # Fit the travel time estimator on the new routes every night
+    application.job_queue.run_daily(recalibrate_estimator, time=CALIBRATION_TIME)
+
     # Run the bot until the user presses Ctrl-C
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
+    # Drop the blocking jobs still waiting in the worker pool
+    shutdown()
+
 if __name__ == "__main__":
 
     main()
\ No newline at end of file
@@ -0,0 +1,162 @@
+from datetime import datetime
+import googlemaps
+import threading
+import sqlite3
+import json
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils import settings
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_CACHE = PATH + "/Data/directions.sqlite"
+ROUND_DIGITS = 3 # endpoints are rounded to ~100m
+TIME_BUCKET = 15 * 60 # in seconds, arrival times in the same bucket share the same route
+TTL = {
+    "walking": 30 * 24 * 3600,
+    "bicycling": 30 * 24 * 3600,
+    "driving": 7 * 24 * 3600,
+    "transit": 30 * 60,
+}
+TIME_DEPENDENT_MODES = {"transit"} # modes for which the arrival time changes the route
+
+_LOCK = threading.Lock()
+_CLIENT = None
+_DB = None
+_MEMORY = {} # key -> (expiry timestamp, response)
+_STATS = {"hits": 0, "misses": 0}
+
+
+class RedirectedClient(googlemaps.Client):
+    """Google Maps client sending its requests to another base URL, e.g. a local stand-in (see Benchmark/standins.py)."""
+
+    def __init__(self, *args, base_url: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, url, params, first_request_time=None, retry_counter=0, base_url=None, *args, **kwargs):
+        return super()._request(url, params, first_request_time, retry_counter, self.base_url, *args, **kwargs)
+
+
+def get_client() -> googlemaps.Client:
+    """Returns the Google Maps client, created once. Requests go to URL_GOOGLEMAPS if set (non-empty) in the settings,
+    which is only meant for stand-ins: leave it empty to use the default endpoint of googlemaps."""
+    global _CLIENT
+
+    with _LOCK:
+        if _CLIENT is None:
+            key = settings.get_parameter("API_KEY_GOOGLEMAPS")
+            base_url = settings.get_snapshot().data.get("URL_GOOGLEMAPS")
+            _CLIENT = RedirectedClient(key=key, base_url=base_url) if base_url else googlemaps.Client(key=key)
+        return _CLIENT
+
+
+def _get_db() -> sqlite3.Connection:
+    """Opens the on-disk cache once. Must be called while holding _LOCK."""
+    global _DB
+
+    if _DB is None:
+        os.makedirs(os.path.dirname(PATH_CACHE), exist_ok=True)
+        _DB = sqlite3.connect(PATH_CACHE, check_same_thread=False)
+        _DB.execute("CREATE TABLE IF NOT EXISTS directions (key TEXT PRIMARY KEY, response TEXT, expires REAL)")
+
+    return _DB
+
+
+def make_key(start_lat: float, start_lon: float, end_lat: float, end_lon: float, arrival_time: datetime, mode: str) -> str:
+    """Builds the cache key of a request: rounded endpoints, mode and (for transit) arrival-time bucket."""
+
+    if mode in TIME_DEPENDENT_MODES and arrival_time:
+        bucket = int(arrival_time.timestamp()) // TIME_BUCKET
+    else:
+        bucket = "-"
+
+    d = ROUND_DIGITS
+    return f"{mode}|{float(start_lat):.{d}f},{float(start_lon):.{d}f}|{float(end_lat):.{d}f},{float(end_lon):.{d}f}|{bucket}"
+
+
+def _lookup(key: str):
+    """Returns the cached response of a key, None if missing or expired."""
+    now = time.time()
+
+    with _LOCK:
+        cached = _MEMORY.get(key)
+
+        if cached is None:
+            row = _get_db().execute("SELECT expires, response FROM directions WHERE key = ?", (key,)).fetchone()
+            if row:
+                cached = _MEMORY[key] = (row[0], json.loads(row[1]))
+
+        if cached and cached[0] > now:
+            _STATS["hits"] += 1
+            return cached[1]
+
+        # Expired entries are dropped on access, the on-disk ones by clear_expired
+        if cached:
+            del _MEMORY[key]
+
+        _STATS["misses"] += 1
+        return None
+
+
+def _store(key: str, response: list, ttl: float):
+    expires = time.time() + ttl
+
+    with _LOCK:
+        _MEMORY[key] = (expires, response)
+        db = _get_db()
+        db.execute("INSERT OR REPLACE INTO directions VALUES (?, ?, ?)", (key, json.dumps(response), expires))
+        db.commit()
+
+
+def get_directions(start_lat: float, start_lon: float, end_lat: float, end_lon: float, arrival_time: datetime = None, mode: str = "walking") -> list:
+    """Returns the Google Maps Directions response between two points, from the cache when possible.
+    Walking, cycling and driving routes are kept for days, transit routes for TTL["transit"] seconds only.
+
+    Args:
+        start_lat (float): starting point latitude.
+        start_lon (float): starting point longitude.
+        end_lat (float): ending point latitude.
+        end_lon (float): ending point longitude.
+        arrival_time (datetime, optional): if not None, specifies the arrival time when computing the route. Defaults to None.
+        mode (str, optional): Mode of transit. Values: "walking", "bicycling", "transit", "driving". Defaults to "walking".
+
+    Returns:
+        list: full detailled route.
+    """
+    key = make_key(start_lat, start_lon, end_lat, end_lon, arrival_time, mode)
+    response = _lookup(key)
+
+    if response is not None:
+        return response
+
+    kwargs = {"arrival_time": arrival_time} if arrival_time else {}
+    response = get_client().directions(origin=f"{start_lat},{start_lon}", destination=f"{end_lat},{end_lon}", mode=mode, **kwargs)
+
+    # Empty responses (no route found) are not cached
+    if response:
+        _store(key, response, TTL.get(mode, min(TTL.values())))
+
+    return response
+
+
+def get_stats() -> dict:
+    """Returns the number of cache hits and misses since the start."""
+    with _LOCK:
+        return dict(_STATS)
+
+
+def clear_expired():
+    """Drops the expired routes from the caches. Meant to be scheduled (see Oscar.py), the on-disk cache otherwise
+    keeps every transit route ever requested."""
+    now = time.time()
+
+    with _LOCK:
+        for key in [key for key, (expires, _) in _MEMORY.items() if expires <= now]:
+            del _MEMORY[key]
+        db = _get_db()
+        db.execute("DELETE FROM directions WHERE expires <= ?", (now,))
+        db.commit()
@@ -0,0 +1,143 @@
+from collections import defaultdict
+from contextlib import closing
+import numpy as np
+import threading
+import sqlite3
+import glob
+import json
+import os
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_RECORDED = PATH + "/Data/route_*.json"
+PATH_DIRECTIONS_CACHE = PATH + "/Data/directions.sqlite"
+EARTH_RADIUS = 6371008.8 # in meters
+MIN_SAMPLES = 3 # number of recorded routes needed to replace the default parameters of a mode
+
+# Default parameters per mode: speed (m/s) along the route, and detour factor (route length / straight-line distance)
+DEFAULT_MODEL = {
+    "walking": (1.3, 1.3),
+    "bicycling": (4.5, 1.3),
+    "driving": (9.0, 1.4),
+}
+
+_LOCK = threading.Lock()
+_MODEL = None
+
+
+def haversine(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Great-circle distance in meters between points, vectorised: arguments can be floats or arrays of the same shape."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=float)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def _samples(route: list) -> tuple:
+    """Extracts (mode, straight-line distance, route distance, duration) from a Directions response, None if unusable."""
+    try:
+        leg = route[0]["legs"][0]
+        modes = {step["travel_mode"].lower() for step in leg["steps"]}
+    except (IndexError, KeyError, TypeError):
+        return None
+
+    # Only single-mode routes calibrate a mode (transit routes mix walking and vehicles)
+    if len(modes) != 1 or next(iter(modes)) not in DEFAULT_MODEL:
+        return None
+
+    start, end = leg["start_location"], leg["end_location"]
+    straight = float(haversine(start["lat"], start["lng"], end["lat"], end["lng"]))
+
+    if straight < 50 or leg["duration"]["value"] <= 0:
+        return None
+
+    return next(iter(modes)), straight, leg["distance"]["value"], leg["duration"]["value"]
+
+
+def _recorded_routes() -> list:
+    """Loads the recorded Directions responses: Route/Data/route_*.json and the Directions cache (see Directions.py)."""
+    routes = []
+
+    for path in glob.glob(PATH_RECORDED):
+        try:
+            with open(path, "r") as json_file:
+                routes.append(json.load(json_file))
+        except (OSError, ValueError):
+            continue
+
+    if os.path.exists(PATH_DIRECTIONS_CACHE):
+        # The context manager of a connection only commits: closing() releases it
+        with closing(sqlite3.connect(PATH_DIRECTIONS_CACHE)) as db:
+            routes.extend(json.loads(row[0]) for row in db.execute("SELECT response FROM directions"))
+
+    return routes
+
+
+def calibrate(routes: list = None) -> dict:
+    """Fits the speed and detour factor of each mode (median over the recorded routes).
+    Modes with less than MIN_SAMPLES routes keep their default parameters.
+
+    Args:
+        routes (list, optional): Directions responses. Defaults to None (the recorded responses).
+
+    Returns:
+        dict: key is the mode, value is (speed in m/s, detour factor).
+    """
+    routes = _recorded_routes() if routes is None else routes
+    samples = defaultdict(list)
+
+    for route in routes:
+        sample = _samples(route)
+        if sample:
+            samples[sample[0]].append(sample[1:])
+
+    model = dict(DEFAULT_MODEL)
+
+    for mode, values in samples.items():
+        if len(values) >= MIN_SAMPLES:
+            straight, distance, duration = np.array(values, dtype=float).T
+            model[mode] = (float(np.median(distance / duration)), float(np.median(distance / straight)))
+
+    return model
+
+
+def get_model() -> dict:
+    """Returns the model, calibrated on first use."""
+    global _MODEL
+
+    with _LOCK:
+        if _MODEL is None:
+            _MODEL = calibrate()
+        return _MODEL
+
+
+def recalibrate():
+    """Calibrates the model again on the routes cached since, scheduled every night (see Oscar.py)."""
+    global _MODEL
+    model = calibrate()
+
+    with _LOCK:
+        _MODEL = model
+
+
+def estimate(lat1, lon1, lat2, lon2, mode: str = "walking") -> tuple:
+    """Estimates instantly, without any request, the distance and duration of trips. Vectorised: arguments can be
+    floats or arrays of the same shape to score many origin/destination pairs at once.
+
+    Args:
+        mode (str, optional): "walking", "bicycling" or "driving". Defaults to "walking".
+
+    Returns:
+        tuple: (distance in meters, duration in seconds), floats or arrays.
+    """
+    speed, detour = get_model()[mode]
+    distance = haversine(lat1, lon1, lat2, lon2) * detour
+
+    return distance, distance / speed
+
+
+def string_estimate(lat1: float, lon1: float, lat2: float, lon2: float, modes: list = ("walking", "bicycling", "driving")) -> str:
+    """Summary of the estimated duration of each mode."""
+    icons = {"walking": "🚶", "bicycling": "🚲", "driving": "🚘"}
+    durations = [f"{icons[mode]} ~{int(estimate(lat1, lon1, lat2, lon2, mode)[1] // 60)}min" for mode in modes]
+
+    return "⏱️ Estimated travel time: " + ", ".join(durations) + "."
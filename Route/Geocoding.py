@@ -0,0 +1,143 @@
+from geopy.geocoders import Nominatim
+from collections import OrderedDict
+import threading
+import sqlite3
+import time
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils.RateLimit import TokenBucket
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_CACHE = PATH + "/Data/geocode.sqlite"
+USER_AGENT = "Oscar"
+LRU_SIZE = 1024
+NOT_FOUND_TTL = 7 * 24 * 3600 # in seconds, addresses not found are retried after a week
+
+_GEOLOCATOR = Nominatim(user_agent=USER_AGENT)
+# Nominatim usage policy: at most 1 request per second
+_BUCKET = TokenBucket(rate=1, capacity=1)
+
+_LOCK = threading.Lock()
+_LRU = OrderedDict() # normalised address -> (lat, lon) or None if not found
+_DB = None
+
+
+def normalize(address: str) -> str:
+    """Normalises an address to use it as cache key: "  Rolex Learning Center,  Ecublens " -> "rolex learning center, ecublens"."""
+    return " ".join(address.lower().split()).strip(" ,")
+
+
+def _get_db() -> sqlite3.Connection:
+    """Opens the on-disk cache once. Must be called while holding _LOCK."""
+    global _DB
+
+    if _DB is None:
+        os.makedirs(os.path.dirname(PATH_CACHE), exist_ok=True)
+        _DB = sqlite3.connect(PATH_CACHE, check_same_thread=False)
+        _DB.execute("CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, lat REAL, lon REAL, updated REAL)")
+
+    return _DB
+
+
+def _remember(key: str, coordinates):
+    """Stores a result in the LRU, evicting the least recently used entry. Must be called while holding _LOCK."""
+    _LRU[key] = coordinates
+    _LRU.move_to_end(key)
+
+    if len(_LRU) > LRU_SIZE:
+        _LRU.popitem(last=False)
+
+
+def _lookup(key: str) -> tuple:
+    """Looks up the caches (memory then disk).
+
+    Returns:
+        tuple: (found, coordinates). coordinates is None for addresses known to be not found.
+    """
+    with _LOCK:
+        if key in _LRU:
+            _LRU.move_to_end(key)
+            return True, _LRU[key]
+
+        row = _get_db().execute("SELECT lat, lon, updated FROM geocode WHERE address = ?", (key,)).fetchone()
+
+        if row is None or (row[0] is None and time.time() - row[2] > NOT_FOUND_TTL):
+            return False, None
+
+        coordinates = (row[0], row[1]) if row[0] is not None else None
+        _remember(key, coordinates)
+
+        return True, coordinates
+
+
+def _store(key: str, coordinates):
+    with _LOCK:
+        _remember(key, coordinates)
+        lat, lon = coordinates if coordinates else (None, None)
+        db = _get_db()
+        db.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)", (key, lat, lon, time.time()))
+        db.commit()
+
+
+def _query(address: str):
+    """Requests Nominatim, respecting its rate limit. Returns (lat, lon) or None if the address is not found."""
+    _BUCKET.acquire()
+    location = _GEOLOCATOR.geocode(address)
+
+    return (location.latitude, location.longitude) if location else None
+
+
+def geocode(address: str) -> tuple:
+    """Returns the coordinates of an address, from the caches when possible.
+
+    Args:
+        address (str): address.
+
+    Raises:
+        ValueError: the address could not be found.
+
+    Returns:
+        tuple: (lat, lon)
+    """
+    key = normalize(address)
+    found, coordinates = _lookup(key)
+
+    if not found:
+        coordinates = _query(address)
+        _store(key, coordinates)
+
+    if coordinates is None:
+        raise ValueError(f"Address {address!r} could not be found")
+
+    return coordinates
+
+
+def geocode_many(addresses: list) -> dict:
+    """Geocodes several addresses in one pass: duplicates (after normalisation) are only geocoded once,
+    and only the addresses missing from the caches are requested, one per second.
+
+    Args:
+        addresses (list): addresses.
+
+    Returns:
+        dict: key is the address, value is (lat, lon) or None if it could not be found.
+    """
+    keys = {address: normalize(address) for address in addresses if address}
+    results = {}
+
+    for address, key in keys.items():
+        if key in results:
+            continue
+
+        found, coordinates = _lookup(key)
+
+        if not found:
+            coordinates = _query(address)
+            _store(key, coordinates)
+
+        results[key] = coordinates
+
+    return {address: results[key] for address, key in keys.items()}
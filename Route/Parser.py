@@ -0,0 +1,99 @@
+from typing import NamedTuple
+
+
+class TransitLeg(NamedTuple):
+    """Step of a route done by public transport. Times are epochs (in seconds)."""
+    departure_stop: str
+    departure_time: int
+    arrival_stop: str
+    arrival_time: int
+    nb_stops: int
+    transport: str
+
+
+class RouteSummary(NamedTuple):
+    """Compact summary of one route of a Directions response, over all its legs (waypoints)."""
+    mode: str # "driving", "transit", "bicycling" or "walking"
+    distance: int # in meters
+    duration: int # in seconds
+    distance_text: str
+    duration_text: str
+    departure_time: int # epoch, None if the route has no schedule (no transit)
+    arrival_time: int # epoch, None if the route has no schedule (no transit)
+    transit: tuple # TransitLeg of each step done by public transport, in order
+    nb_legs: int
+
+
+def distance_text(distance: int) -> str:
+    """Formats a distance in meters as Google Maps does: "850 m", "1.3 km"."""
+    return f"{distance} m" if distance < 1000 else f"{distance / 1000:.1f} km"
+
+
+def duration_text(duration: int) -> str:
+    """Formats a duration in seconds as Google Maps does: "17 mins", "1 hour 5 mins"."""
+    hours, minutes = divmod(round(duration / 60), 60)
+    text = f"{minutes} min" + ("s" if minutes != 1 else "")
+
+    if hours:
+        text = f"{hours} hour" + ("s" if hours != 1 else "") + (f" {text}" if minutes else "")
+
+    return text
+
+
+def parse_route(route: dict) -> RouteSummary:
+    """Parses one route of a Directions response, walking its legs and steps once.
+
+    Args:
+        route (dict): one route, e.g. response[0].
+
+    Returns:
+        RouteSummary: summary of the route.
+    """
+    legs = route["legs"]
+    distance = duration = 0
+    transit = []
+    last_mode = None
+
+    for leg in legs:
+        distance += leg["distance"]["value"]
+        duration += leg["duration"]["value"]
+
+        for step in leg["steps"]:
+            last_mode = step["travel_mode"]
+            details = step.get("transit_details")
+
+            if details:
+                transit.append(TransitLeg(
+                    departure_stop=details["departure_stop"]["name"],
+                    departure_time=details["departure_time"]["value"],
+                    arrival_stop=details["arrival_stop"]["name"],
+                    arrival_time=details["arrival_time"]["value"],
+                    nb_stops=details["num_stops"],
+                    # Some lines (e.g. trains) have no short name
+                    transport=details["line"].get("short_name") or details["line"].get("name"),
+                ))
+
+    if last_mode == "DRIVING":
+        mode = "driving"
+    elif transit:
+        mode = "transit"
+    elif last_mode == "BICYCLING":
+        mode = "bicycling"
+    else:
+        mode = "walking"
+
+    # A single leg keeps the texts of Google Maps, several legs are summed
+    if len(legs) == 1:
+        texts = legs[0]["distance"]["text"], legs[0]["duration"]["text"]
+    else:
+        texts = distance_text(distance), duration_text(duration)
+
+    departure_time = legs[0].get("departure_time", {}).get("value")
+    arrival_time = legs[-1].get("arrival_time", {}).get("value")
+
+    return RouteSummary(mode, distance, duration, *texts, departure_time, arrival_time, tuple(transit), len(legs))
+
+
+def parse_routes(response: list) -> list:
+    """Parses all the routes (alternatives) of a Directions response, the first one being the recommended one."""
+    return [parse_route(route) for route in response]
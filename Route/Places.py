@@ -0,0 +1,201 @@
+from collections import defaultdict
+from typing import NamedTuple
+import numpy as np
+import threading
+import logging
+import glob
+import json
+import math
+import os
+
+# When run as a script, 'Route' resolves to Route.py instead of the package
+if __package__:
+    from Route import Geocoding, Estimator
+else:
+    import Geocoding
+    import Estimator
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_PLACES = PATH + "/Data/Places/*.jsonl" # records written by scrap.py
+GRID_STEP = 0.01 # in degrees, size of the cells of the spatial index (~1km)
+NEAREST = 5 # number of places returned by default
+
+logger = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+_STORE = None
+
+
+class Place(NamedTuple):
+    name: str
+    address: str
+    lat: float
+    lon: float
+    category: str
+    link: str
+
+
+def to_category(path: str) -> str:
+    """Category of the places of a records file, from the search that produced it: ".../school_near_me.jsonl" -> "school"."""
+    name = os.path.basename(path).removesuffix(".jsonl").removesuffix("_near_me")
+    return name.replace("_", " ")
+
+
+def read_records(path: str) -> list:
+    """Reads the records of a scraping run, keeping the ones with an address (the "Address: ..." label)."""
+    records = []
+
+    with open(path, "r", encoding="utf-8") as read_file:
+        for line in read_file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            details = dict(label.split(": ", 1) for label in record.get("labels", []) if ": " in label)
+
+            if details.get("Address"):
+                records.append((record.get("name") or "Unnamed place", details["Address"], record.get("link")))
+
+    return records
+
+
+class PlaceIndex:
+    """Places of a category, bucketed in a grid of GRID_STEP degrees to answer nearest-neighbour queries
+    by only looking at the cells around the query point."""
+
+    def __init__(self, places: list, step: float = GRID_STEP):
+        self.places = places
+        self.step = step
+        self.lat = np.array([place.lat for place in places], dtype=float)
+        self.lon = np.array([place.lon for place in places], dtype=float)
+
+        cells = defaultdict(list)
+        for i, (lat, lon) in enumerate(zip(self.lat, self.lon)):
+            cells[self.to_cell(lat, lon)].append(i)
+
+        self.keys = np.array(list(cells), dtype=int).reshape(-1, 2)
+        self.cells = [np.array(indices) for indices in cells.values()]
+
+    def __len__(self):
+        return len(self.places)
+
+    def to_cell(self, lat: float, lon: float) -> tuple:
+        return math.floor(lat / self.step), math.floor(lon / self.step)
+
+    def nearest(self, lat: float, lon: float, n: int = NEAREST) -> list:
+        """Returns the n places closest to a point.
+
+        Returns:
+            list: list of (Place, distance in meters), closest first.
+        """
+        n = min(n, len(self.places))
+
+        if n <= 0:
+            return []
+
+        # Cells ordered by ring (Chebyshev distance in cells) around the cell of the point
+        rings = np.abs(self.keys - self.to_cell(lat, lon)).max(axis=1)
+        order = np.argsort(rings, kind="stable")
+        # A place beyond ring r is at least r cells away from the point
+        cell_size = Estimator.EARTH_RADIUS * math.radians(self.step) * math.cos(math.radians(abs(lat) + self.step))
+
+        candidates = []
+
+        for k, cell in enumerate(order):
+            candidates.append(self.cells[cell])
+            ring = rings[cell]
+
+            # The candidates are complete once the ring is finished and the n-th closest is within its reach
+            if k + 1 < len(order) and rings[order[k + 1]] == ring:
+                continue
+
+            if sum(map(len, candidates)) >= n:
+                indices = np.concatenate(candidates)
+                distances = Estimator.haversine(lat, lon, self.lat[indices], self.lon[indices])
+
+                if np.partition(distances, n - 1)[n - 1] <= ring * cell_size:
+                    break
+
+        indices = np.concatenate(candidates)
+        distances = Estimator.haversine(lat, lon, self.lat[indices], self.lon[indices])
+        closest = np.argsort(distances)[:n]
+
+        return [(self.places[indices[i]], float(distances[i])) for i in closest]
+
+
+class PlaceStore:
+    """Places scraped by scrap.py, geocoded once (see Geocoding.py) and indexed by category."""
+
+    def __init__(self, paths: list):
+        self.version = {path: os.stat(path).st_mtime_ns for path in paths}
+        records = {path: read_records(path) for path in paths}
+
+        coordinates = Geocoding.geocode_many([address for rows in records.values() for _, address, _ in rows])
+
+        places = defaultdict(list)
+        for path, rows in records.items():
+            for name, address, link in rows:
+                if coordinates.get(address):
+                    places[to_category(path)].append(Place(name, address, *coordinates[address], to_category(path), link))
+
+        self.indexes = {category: PlaceIndex(category_places) for category, category_places in places.items()}
+        logger.info("%d places loaded in %d categories", sum(map(len, self.indexes.values())), len(self.indexes))
+
+    def categories(self) -> list:
+        return sorted(self.indexes)
+
+    def find_category(self, query: str) -> str:
+        """Category matching a query, tolerating plurals: "schools" -> "school". None if there is none."""
+        query = " ".join(query.lower().split())
+
+        for candidate in (query, query.removesuffix("s"), query.removesuffix("es")):
+            if candidate in self.indexes:
+                return candidate
+
+        return None
+
+    def nearest(self, category: str, lat: float, lon: float, n: int = NEAREST) -> list:
+        """Returns the n places of a category closest to a point, as (Place, distance in meters)."""
+        return self.indexes[category].nearest(lat, lon, n)
+
+
+def get_store() -> PlaceStore:
+    """Returns the current place store, None until the first reload is done. Never blocks: queries read the store
+    built by the last reload."""
+    return _STORE
+
+
+def reload() -> PlaceStore:
+    """Builds the place store again if the records of the scraper changed since the last load, and returns it.
+    Meant to be called by a scheduled job, not on the query path (listing and stating the records is not free)."""
+    global _STORE
+    paths = sorted(glob.glob(PATH_PLACES))
+
+    with _LOCK:
+        if _STORE is None or _STORE.version != {path: os.stat(path).st_mtime_ns for path in paths}:
+            _STORE = PlaceStore(paths)
+        return _STORE
+
+
+def string_nearest(query: str, lat: float, lon: float, n: int = NEAREST) -> str:
+    """Summary of the places of a category closest to a point."""
+    store = get_store()
+
+    if store is None:
+        return "📍 The places are still loading, try again in a minute."
+
+    category = store.find_category(query)
+
+    if category is None:
+        available = ", ".join(store.categories()) or "none, run Route/scrap.py first"
+        return f"🤷 I don't know any {query}. Known places: {available}."
+
+    lines = [f"📍 Nearest {category} places:"]
+
+    for i, (place, distance) in enumerate(store.nearest(category, lat, lon, n), start=1):
+        distance = f"{distance:.0f} m" if distance < 1000 else f"{distance / 1000:.1f} km"
+        lines.append(f"{i}. {place.name} ({distance}) - {place.address}")
+
+    return "\n".join(lines)
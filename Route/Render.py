@@ -0,0 +1,269 @@
+import numpy as np
+import tempfile
+import hashlib
+import folium
+import struct
+import json
+import zlib
+import os
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_MAPS = PATH + "/Data/Maps"
+EARTH_RADIUS = 6371008.8 # in meters
+SIMPLIFY_TOLERANCE = 10 # in meters, maximum distance between the simplified and the original route
+IMAGE_SIZE = 512 # in pixels, side of the static images (svg and png)
+FORMATS = ("html", "geojson", "svg", "png")
+BINARY_FORMATS = {"png"}
+LINE_WIDTH = 4 # in pixels
+MARKER_RADIUS = 7 # in pixels
+COLORS = {"line": (0, 0, 255), "start": (0, 128, 0), "end": (255, 0, 0)} # RGB, same as the named SVG colors
+
+
+def decode_polyline(points: str, precision: int = 5) -> np.ndarray:
+    """Decodes an encoded polyline (Google format), vectorised.
+
+    Args:
+        points (str): encoded polyline, e.g. route[0]["overview_polyline"]["points"].
+        precision (int, optional): number of decimals of the coordinates. Defaults to 5.
+
+    Returns:
+        np.ndarray: array of shape (n, 2) of (lat, lon).
+    """
+    chunks = np.frombuffer(points.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+
+    if not chunks.size:
+        return np.empty((0, 2))
+
+    # Each value is a run of 5-bit chunks, the last one has its 0x20 bit unset
+    last = (chunks & 0x20) == 0
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    value_index = np.cumsum(np.concatenate(([False], last[:-1])))
+    position = np.arange(chunks.size) - starts[value_index]
+    values = np.add.reduceat((chunks & 0x1f) << (5 * position), starts)
+
+    # Zigzag-encoded deltas
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def simplify(coordinates: np.ndarray, tolerance: float = SIMPLIFY_TOLERANCE) -> np.ndarray:
+    """Simplifies a line with the Douglas-Peucker algorithm: only the points further than tolerance meters from
+    the simplified line are kept.
+
+    Args:
+        coordinates (np.ndarray): array of shape (n, 2) of (lat, lon).
+        tolerance (float, optional): in meters. Defaults to SIMPLIFY_TOLERANCE.
+
+    Returns:
+        np.ndarray: the kept points, in order.
+    """
+    n = len(coordinates)
+
+    if n < 3 or tolerance <= 0:
+        return coordinates
+
+    # Equirectangular projection (in meters), precise enough at the scale of a route
+    lat = np.radians(coordinates[:, 0])
+    lon = np.radians(coordinates[:, 1])
+    points = EARTH_RADIUS * np.column_stack((lon * np.cos(lat.mean()), lat))
+
+    keep = np.zeros(n, dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        i, j = stack.pop()
+
+        if j - i < 2:
+            continue
+
+        segment = points[j] - points[i]
+        relative = points[i + 1:j] - points[i]
+        length = np.hypot(*segment)
+
+        if length:
+            distances = np.abs(segment[0] * relative[:, 1] - segment[1] * relative[:, 0]) / length
+        else:
+            distances = np.hypot(relative[:, 0], relative[:, 1])
+
+        k = int(np.argmax(distances))
+
+        if distances[k] > tolerance:
+            k += i + 1
+            keep[k] = True
+            stack.extend(((i, k), (k, j)))
+
+    return coordinates[keep]
+
+
+def get_path(route: list) -> np.ndarray:
+    """Returns the (lat, lon) points of the overview polyline of a Directions response."""
+    return decode_polyline(route[0]["overview_polyline"]["points"])
+
+
+def to_geojson(route: list, tolerance: float = SIMPLIFY_TOLERANCE) -> dict:
+    """GeoJSON FeatureCollection of a route: the simplified line, the start and the end."""
+    leg = route[0]["legs"][0]
+    path = simplify(get_path(route), tolerance)
+
+    def point(location: dict, address: str) -> dict:
+        return {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": [location["lng"], location["lat"]]},
+            "properties": {"address": address},
+        }
+
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                # GeoJSON coordinates are (lon, lat), rounded to ~1m
+                "geometry": {"type": "LineString", "coordinates": np.round(path[:, ::-1], 5).tolist()},
+                "properties": {"distance": leg["distance"]["value"], "duration": leg["duration"]["value"]},
+            },
+            point(leg["start_location"], leg.get("start_address")),
+            point(leg["end_location"], leg.get("end_address")),
+        ],
+    }
+
+
+def project(path: np.ndarray, size: int = IMAGE_SIZE) -> tuple:
+    """Projects (lat, lon) points to the pixels (x, y) of a square image, north up, with a margin of 5%."""
+    # Same projection as simplify, scaled to fit the image
+    lat = np.radians(path[:, 0])
+    x = np.radians(path[:, 1]) * np.cos(lat.mean())
+    y = -lat
+    margin = size * 0.05
+    scale = (size - 2 * margin) / max(np.ptp(x), np.ptp(y), 1e-9)
+
+    return margin + (x - x.min()) * scale, margin + (y - y.min()) * scale
+
+
+def to_svg(route: list, tolerance: float = SIMPLIFY_TOLERANCE, size: int = IMAGE_SIZE) -> str:
+    """Static SVG image of a route (line, start in green, end in red), without any tile."""
+    x, y = project(simplify(get_path(route), tolerance), size)
+
+    points = " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(x, y))
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" viewBox="0 0 {size} {size}">'
+        f'<rect width="100%" height="100%" fill="white"/>'
+        f'<polyline points="{points}" fill="none" stroke="blue" stroke-width="{LINE_WIDTH}" stroke-linejoin="round"/>'
+        f'<circle cx="{x[0]:.1f}" cy="{y[0]:.1f}" r="{MARKER_RADIUS}" fill="green"/>'
+        f'<circle cx="{x[-1]:.1f}" cy="{y[-1]:.1f}" r="{MARKER_RADIUS}" fill="red"/>'
+        f'</svg>'
+    )
+
+
+def stamp(image: np.ndarray, x: np.ndarray, y: np.ndarray, radius: float, color: tuple):
+    """Paints a disc of radius pixels around each point (x, y) of an RGB image, vectorised."""
+    r = int(np.ceil(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    disc = dx ** 2 + dy ** 2 <= radius ** 2
+
+    columns = np.rint(np.atleast_1d(x)).astype(int)[:, None] + dx[disc][None, :]
+    rows = np.rint(np.atleast_1d(y)).astype(int)[:, None] + dy[disc][None, :]
+    inside = (columns >= 0) & (columns < image.shape[1]) & (rows >= 0) & (rows < image.shape[0])
+
+    image[rows[inside], columns[inside]] = color
+
+
+def encode_png(image: np.ndarray) -> bytes:
+    """Encodes an RGB image (array of shape (height, width, 3)) as a PNG file, with the standard library only."""
+    height, width, _ = image.shape
+    # Each scanline starts with its filter type, 0 (none)
+    scanlines = np.column_stack((np.zeros(height, dtype=np.uint8), image.astype(np.uint8).reshape(height, -1)))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # 8 bits per channel, color type 2 (RGB), default compression, filtering and no interlacing
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 9)) + chunk(b"IEND", b"")
+
+
+def to_png(route: list, tolerance: float = SIMPLIFY_TOLERANCE, size: int = IMAGE_SIZE) -> bytes:
+    """Static PNG image of a route, drawn like to_svg. Unlike SVG, it can be sent as a photo on Telegram."""
+    x, y = project(simplify(get_path(route), tolerance), size)
+    image = np.full((size, size, 3), 255, dtype=np.uint8)
+
+    # Points every half pixel along each segment, each painted with a disc of the width of the line
+    steps = np.maximum(np.ceil(np.hypot(np.diff(x), np.diff(y)) * 2).astype(int), 1)
+    segment = np.repeat(np.arange(steps.size), steps)
+    t = (np.arange(segment.size) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[segment]
+    line_x = np.append(x[segment] + t * (x[segment + 1] - x[segment]), x[-1])
+    line_y = np.append(y[segment] + t * (y[segment + 1] - y[segment]), y[-1])
+
+    stamp(image, line_x, line_y, LINE_WIDTH / 2, COLORS["line"])
+    stamp(image, x[0], y[0], MARKER_RADIUS, COLORS["start"])
+    stamp(image, x[-1], y[-1], MARKER_RADIUS, COLORS["end"])
+
+    return encode_png(image)
+
+
+def to_html(route: list, tolerance: float = SIMPLIFY_TOLERANCE) -> str:
+    """Interactive folium map of a route."""
+    leg = route[0]["legs"][0]
+    start = [leg["start_location"]["lat"], leg["start_location"]["lng"]]
+    end = [leg["end_location"]["lat"], leg["end_location"]["lng"]]
+
+    path = simplify(get_path(route), tolerance)
+
+    mymap = folium.Map(location=start, tiles="CartoDB positron")
+    folium.PolyLine(locations=path.tolist(), color="blue", weight=5).add_to(mymap)
+    folium.Marker(location=start, popup=leg.get("start_address")).add_to(mymap)
+    folium.Marker(location=end, popup=leg.get("end_address")).add_to(mymap)
+    mymap.fit_bounds([path.min(axis=0).tolist(), path.max(axis=0).tolist()])
+
+    return mymap.get_root().render()
+
+
+def make_key(route: list, format: str, tolerance: float) -> str:
+    """Content address of a rendering: hash of the polyline and of the rendering options."""
+    content = f"{route[0]['overview_polyline']['points']}|{format}|{tolerance}"
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def render(route: list, format: str = "html", tolerance: float = SIMPLIFY_TOLERANCE) -> str:
+    """Renders a Directions response to a file named after its content, so that the same route is only rendered
+    once and concurrent renderings never overwrite each other.
+
+    Args:
+        route (list): Directions response.
+        format (str, optional): "html" (interactive map), "geojson", "svg" or "png" (static images). Defaults to "html".
+        tolerance (float, optional): simplification tolerance in meters, 0 to keep all the points. Defaults to SIMPLIFY_TOLERANCE.
+
+    Returns:
+        str: path of the rendered file.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"Unknown format {format!r}, expected one of {FORMATS}")
+
+    file_path = f"{PATH_MAPS}/{make_key(route, format, tolerance)}.{format}"
+
+    if os.path.exists(file_path):
+        return file_path
+
+    if format == "geojson":
+        content = json.dumps(to_geojson(route, tolerance))
+    elif format == "svg":
+        content = to_svg(route, tolerance)
+    elif format == "png":
+        content = to_png(route, tolerance)
+    else:
+        content = to_html(route, tolerance)
+
+    # Written to a temporary file first: readers never see a partial file
+    os.makedirs(PATH_MAPS, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=PATH_MAPS, suffix=".tmp")
+    with os.fdopen(fd, "wb" if format in BINARY_FORMATS else "w") as file:
+        file.write(content)
+    # mkstemp creates the file readable by its owner only
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, file_path)
+
+    return file_path
@@ -1,43 +1,59 @@
-from geopy.geocoders import Nominatim
 from datetime import datetime, timedelta
 import openrouteservice
-import googlemaps
 import webbrowser
 import os
 import json
 import sys
-import folium
-import polyline
 import datetime
-import copy
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Utils import settings
+from Utils import settings, Clock
+
+# When run as a script, 'Route' resolves to this file instead of the package
+if __package__:
+    from Route import Geocoding, Directions, Render, Parser
+else:
+    import Geocoding
+    import Directions
+    import Render
+    import Parser
 
 # Constants
 PATH = os.path.dirname(os.path.abspath(__file__))
 OPENROUTESERVICE_MODES = ["foot-walking", "cycling-road", ""]
 GMAPS_MODES = ["walking", "bicycling", "transit", "driving"]
 
+_ORS_CLIENT = None
+
 
 def address_to_coordinates(address: str) -> tuple:
-    """Takes an address and returns its coordinates.
+    """Takes an address and returns its coordinates. Results are cached on disk (see Geocoding.py).
 
     Args:
         address (str): address.
 
+    Raises:
+        ValueError: the address could not be found.
+
     Returns:
         tuple: (lat, lon)
     """
-    loc = Nominatim(user_agent="Geopy Library")
-    getLoc = loc.geocode(address)
-    lat, lon = getLoc.latitude, getLoc.longitude
+    lat, lon = Geocoding.geocode(address)
 
     return lat, lon
 
+def get_ors_client() -> openrouteservice.Client:
+    """Returns the Openrouteservice client, created once."""
+    global _ORS_CLIENT
+
+    if _ORS_CLIENT is None:
+        _ORS_CLIENT = openrouteservice.Client(key=settings.get_parameter("API_KEY_OPENROUTESERVICE"))
+
+    return _ORS_CLIENT
+
 def get_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float, profile: str = "foot-walking"):
     
-    client = openrouteservice.Client(key=settings.get_parameter("API_KEY_OPENROUTESERVICE"))
+    client = get_ors_client()
 
     coordinates = [[start_lon, start_lat], [end_lon, end_lat]]
 
@@ -51,6 +67,26 @@ def get_route(start_lat: float, start_lon: float, end_lat: float, end_lon: float
 
     return route
 
+def get_matrix(locations: list, profile: str = "foot-walking") -> tuple:
+    """Computes in a single request the travel durations and distances between all the pairs of locations.
+
+    Args:
+        locations (list): list of (lat, lon).
+        profile (str, optional): Openrouteservice profile, e.g. "foot-walking", "cycling-regular", "driving-car". Defaults to "foot-walking".
+
+    Returns:
+        tuple: (durations, distances), matrices (list of lists) in seconds and meters. durations[i][j] is the
+        duration from locations[i] to locations[j], None if no route was found.
+    """
+    matrix = get_ors_client().distance_matrix(
+        locations=[[lon, lat] for lat, lon in locations],
+        profile=profile,
+        metrics=["duration", "distance"],
+        validate=False,
+    )
+
+    return matrix["durations"], matrix["distances"]
+
 def get_time_distance_openrouteservice(route: json):
     """Uses the response from the Openrouteservice API to extract the duration and the distance of the route.
 
@@ -63,10 +99,15 @@ def get_time_distance_openrouteservice(route: json):
 
     return distance, duration
 
+def string_openrouteservice(route: json) -> str:
+    """Summary of a walking route computed by Openrouteservice."""
+    distance, duration = get_time_distance_openrouteservice(route)
+    return f"🧭 Openrouteservice: walk {distance / 1000:.1f}km for about {int(duration // 60)}min."
+
 def get_route_gmaps(start_lat: float, start_lon: float, end_lat: float, end_lon: float, arrival_time: datetime = None, transit: str = "walking"):
     """Computes the full route form the start point to the end point, which are coordinates. 
     If the argument 'arrival_time' is entered, it has to be a datetime object, and the route returned will arrive at this specific time.
-    
+    Routes are cached by rounded endpoints, mode and arrival time (see Directions.py).
 
     Args:
         start_lat (float): starting point latitude.
@@ -79,26 +120,7 @@ def get_route_gmaps(start_lat: float, start_lon: float, end_lat: float, end_lon:
     Returns:
         json: full detailled route.
     """
-    gmaps = googlemaps.Client(key=settings.get_parameter("API_KEY_GOOGLEMAPS"))
-
-    origin = f"{start_lat},{start_lon}"
-    destination = f"{end_lat},{end_lon}"
-    
-    if arrival_time:
-        
-        dir = gmaps.directions(
-            origin = origin,
-            destination = destination,
-            mode= transit,
-            arrival_time = arrival_time)
-    else:
-        
-        dir = gmaps.directions(
-            origin = origin,
-            destination = destination,
-            mode= transit)
-    
-    return dir
+    return Directions.get_directions(start_lat, start_lon, end_lat, end_lon, arrival_time=arrival_time, mode=transit)
 
 def get_route_gmaps_address(start_address: str, end_address: str, arrival_time: datetime = None, transit: str = "walking") -> json:
     """Get the route between two addresses. 
@@ -127,130 +149,31 @@ def get_route_gmaps_address(start_address: str, end_address: str, arrival_time:
     return route
 
 
-def display_route_map(route: json, open_web = None):
-    """Given a route, it displays the path on a map.
+def display_route_map(route: json, open_web = None, format: str = "html") -> str:
+    """Given a route, it renders the path on a map. Renderings are cached by content (see Render.py).
 
     Args:
         route (json): full detailled route.
         open_web (bool, optional): if True, it displays the map on a web page (for terminal use). Defaults to None.
+        format (str, optional): "html" (interactive map), "geojson", "svg" or "png" (static images). A png file can be
+            sent on Telegram with reply_photo, the other formats with reply_document. Defaults to "html".
 
     Returns:
-        mymap: map (for notebooks)
+        str: path of the rendered file.
     """
-    start_coords = [route[0]["legs"][0]["start_location"]["lat"], route[0]["legs"][0]["start_location"]["lng"]]
-    start_address = route[0]["legs"][0]["start_address"]
-    end_coords = [route[0]["legs"][0]["end_location"]["lat"], route[0]["legs"][0]["end_location"]["lng"]]
-    end_address = route[0]["legs"][0]["end_address"]
-
-    # Create a map centered around the starting point
-    mymap = folium.Map(location=start_coords, zoom_start=15)
-    
-    folium.TileLayer('CartoDB dark_matter').add_to(mymap)
-    folium.TileLayer('CartoDB positron').add_to(mymap)
-
-    # Adding a layer control element
-    folium.LayerControl().add_to(mymap)
-
-    overview_polyline = route[0]["overview_polyline"]["points"]
-    decoded_polyline = polyline.decode(overview_polyline)
-
-    # Add the route to the map
-    folium.PolyLine(locations=decoded_polyline, color='blue', weight=5).add_to(mymap)
-    folium.Marker(location=start_coords, popup=start_address).add_to(mymap)
-    folium.Marker(location=end_coords, popup=end_address).add_to(mymap)
-
-    file_path = "Route/Data/route_map.html"
-
-    mymap.save(file_path)
+    file_path = Render.render(route, format=format)
 
     if open_web:
         webbrowser.open('file://' + os.path.realpath(file_path))
 
-    return mymap
-
-
-def get_time_distance(route: json):
-    
-    trip_duration = route[0]["legs"][0]["duration"]["text"] # in seconds
-    trip_distance = route[0]["legs"][0]["distance"]["text"] # in meters
-    
-    try:
-        departure_time = route[0]["legs"][0]["departure_time"]["value"] # in seconds
-    except:
-        departure_time = None
-    
-    return departure_time, trip_duration, trip_distance
+    return file_path
 
 
-
-def get_transport_details(route: json) -> list:
-    """From the dictionnary of the full route, it extracts only the different steps of the route that requires public transport usage. Then, selects some relevant information.
-
-    Args:
-        route (json): full detailled route.
-
-    Returns:
-        list: returns a list of dict, that contains the info of each step. 
-        ex: [
-        {
-            "departure_stop": "Ouchy\u2013Olympique",
-            "departure_time": 1724487000,
-            "arrival_stop": "Lausanne-Flon",
-            "arrival_time": 1724487420,
-            "nb_stops": 5,
-            "transport": "m2"
-        },
-        {
-            "departure_stop": "Lausanne-Flon",
-            "departure_time": 1724487600,
-            "arrival_stop": "EPFL",
-            "arrival_time": 1724488380,
-            "nb_stops": 9,
-            "transport": "m1"
-        }
-        ]
-    """
-
-    transport_details_full = route[0]["legs"]
-    transport_details = transport_details_full[0]["steps"]
-    
-    try:
-        departure_time_route = transport_details_full[0]["departure_time"]["value"]
-        arrival_time_route = transport_details_full[0]["arrival_time"]["value"]
-    except:
-        departure_time_route, arrival_time_route = None, None
-
-    transit_details = []
-
-    for step in range(len(transport_details)):
-        if "transit_details" in list(transport_details[step].keys()):
-
-            details = transport_details[step]["transit_details"]
-            departure_stop = details["departure_stop"]["name"]
-            departure_time = details["departure_time"]["value"] # in sec
-            arrival_stop = details["arrival_stop"]["name"]
-            arrival_time = details["arrival_time"]["value"] # in sec
-            nb_stops = details["num_stops"]
-            transport = details["line"]["short_name"]
-            
-            step_details = {
-                "departure_stop": departure_stop,
-                "departure_time": departure_time,
-                "arrival_stop": arrival_stop,
-                "arrival_time": arrival_time,
-                "nb_stops": nb_stops,
-                "transport": transport
-            }
-
-            transit_details.append(copy.deepcopy(step_details))
-
-    return departure_time_route, arrival_time_route, transit_details
-
-def string_public_transport(transit_details: list) -> list:
-    """Takes the transit details of the route and returns a list of the string for each step.
+def string_public_transport(summary: Parser.RouteSummary) -> list:
+    """Takes the summary of a route and returns a list of the string for each step done by public transport.
 
     Args:
-        transit_details (list): each element is a dictionary of the details of each step of the transports.
+        summary (RouteSummary): parsed route (see Parser.py).
 
     Returns:
         list: list of the strings for each step.
@@ -258,97 +181,69 @@ def string_public_transport(transit_details: list) -> list:
 
     transit_steps = []
 
-    for transit in transit_details:
-        duration = datetime.timedelta(seconds=(transit["arrival_time"] - transit["departure_time"]))
-        transit_step = f" - Take the {transit['transport']} at {transit['departure_stop']} at {convert_epoch_datetime(transit['departure_time']).strftime('%Hh%M')} for {transit['nb_stops']} stops until {transit['arrival_stop']} ({duration.seconds//60}min)."
+    for transit in summary.transit:
+        duration = (transit.arrival_time - transit.departure_time) // 60
+        transit_step = f" - Take the {transit.transport} at {transit.departure_stop} at {convert_epoch_datetime(transit.departure_time).strftime('%Hh%M')} for {transit.nb_stops} stops until {transit.arrival_stop} ({duration}min)."
         transit_steps.append(transit_step)
     
     return transit_steps
 
 
-def string_car(route: json) -> str:
+def string_car(summary: Parser.RouteSummary) -> str:
     """En theorie: si on prend la voiture, alors on s'en tape de tout: 
     - prendre simplement l'heure de départ et l'heure d'arrivée, peut être les km? mais pas besoin de plus."""
-    distance = route[0]["legs"][0]["distance"]["text"]
-    duration = route[0]["legs"][0]["duration"]["text"]
-    out_string = f"🚘 The {distance} should take about {duration}."
-    
-    return out_string
+    return f"🚘 The {summary.distance_text} should take about {summary.duration_text}."
 
 
-def check_public_transport(route: json) -> bool:
-    """Check if the route requires the use of public transports.
+def string_walk(summary: Parser.RouteSummary) -> str:
+    """Summary of a walking (or cycling) route."""
+    if summary.mode == "bicycling":
+        return f"🚲 Ride {summary.distance_text} for about {summary.duration_text}."
 
-    Args:
-        route (json): full detailled route.
+    if summary.departure_time:
+        return f"🚶‍♂️‍➡️ Leave at {convert_epoch_datetime(summary.departure_time).strftime('%Hh%M')} by foot and walk {summary.distance_text} ({summary.duration_text})."
 
-    Returns:
-        bool: True if the route requires the use of public transports. False otherwise.
-    """
+    return f"🚶‍♂️‍➡️ Walk {summary.distance_text} for about {summary.duration_text}."
 
-    transport_details = route[0]["legs"][0]["steps"]
-    
-    check = False
 
-    for step in range(len(transport_details)):
-        if "transit_details" in list(transport_details[step].keys()):
-            check = True
-    
-    return check
+def string_route(summary: Parser.RouteSummary) -> str:
+    """Summary of a route, adapted to the type of transport it uses."""
 
+    if summary.mode == "driving":
+        return string_car(summary)
+
+    if summary.mode == "transit":
+        # Example value of the steps:
+        # "Take the m2 at Ouchy–Olympique at 10h10 for 5 stops until Lausanne-Flon (7min).
+        # Take the m1 at Lausanne-Flon at 10h20 for 9 stops until EPFL (13min)."
+        departure_time_route = convert_epoch_datetime(summary.departure_time or summary.transit[0].departure_time).strftime('%Hh%M')
+        arrival_time_route = convert_epoch_datetime(summary.arrival_time or summary.transit[-1].arrival_time).strftime('%Hh%M')
+        return f"🚌 Leave at {departure_time_route} by foot.\n" + "\n".join(string_public_transport(summary)) + f"\n🎯 Arrival at {arrival_time_route}."
+
+    return string_walk(summary)
 
-def check_car(route: json) -> bool:
-    """Check if the route is done by car.
+
+def export_string_route(route: json, alternatives: bool = False) -> str:
+    """Summary of a Directions response, parsed once (see Parser.py).
 
     Args:
         route (json): full detailled route.
+        alternatives (bool, optional): if True, the duration of the alternative routes is added. Defaults to False.
 
     Returns:
-        bool: True if travel by car. False otherwise.
+        str: summary of the recommended route.
     """
+    summaries = Parser.parse_routes(route)
+    output = string_route(summaries[0])
 
-    if route[0]["legs"][0]["steps"][-1]["travel_mode"] == "DRIVING":
-        check = True
-    else:
-        check = False
-
-    return check
-    
-
-def export_string_route(route: json) -> str:
-    
-    # Check if public transport is used
-    public_transport = check_public_transport(route = route)
-
-    # Check if car is used
-    car = check_car(route = route)
-
-    if car:
-        output = string_car(route = route)
-
-    elif public_transport:
-        departure_time_route, arrival_time_route, transit_details = get_transport_details(route=route)
-        transit_steps_string = string_public_transport(transit_details=transit_details)
-        
-        # Example value of transit_steps_string: 
-        # "Take the m2 at Ouchy–Olympique at 10h10 for 5 stops until Lausanne-Flon (7min).
-        # Take the m1 at Lausanne-Flon at 10h20 for 9 stops until EPFL (13min)."
-        departure_time_route = convert_epoch_datetime(departure_time_route).strftime('%Hh%M')
-        arrival_time_route = convert_epoch_datetime(arrival_time_route).strftime('%Hh%M')
-        output = f"🚌 Leave at {departure_time_route} by foot.\n" + "\n".join(transit_steps_string) + f"\n🎯 Arrival at {arrival_time_route}."
-
-    else:
-        departure_time, trip_duration, trip_distance = get_time_distance(route = route)
-        if departure_time:
-            output = f"🚶‍♂️‍➡️ Leave at {convert_epoch_datetime(departure_time).strftime('%Hh%M')} by foot and walk {trip_distance} ({trip_duration}min)."
-        else:
-            output = f"🚶‍♂️‍➡️ Walk {trip_distance} for about {trip_duration}."
+    if alternatives and len(summaries) > 1:
+        output += "\n🔀 Alternatives: " + ", ".join(f"{summary.duration_text} ({summary.distance_text})" for summary in summaries[1:]) + "."
 
     return output
 
 # && utils function &&
 def convert_epoch_datetime(epoch: int) -> datetime:
-    return datetime.datetime.fromtimestamp(epoch)
+    return datetime.datetime.fromtimestamp(epoch, tz=Clock.get_timezone())
 
 
 if __name__ == "__main__":
@@ -381,15 +276,11 @@ if __name__ == "__main__":
     # # 4. Display the route created with googlemaps api on a map 
     # map = display_route_map(route = route, open_web= True)
 
-    # # 5. Get the duration and distance of the trip
-    # departure_time, trip_duration, trip_distance = get_time_distance(route = route)
-    # print(departure_time, trip_duration, trip_distance, "", sep="\n")
-
-    # # 6. Get the details of the route in the case it takes public transports, and returns the steps
-    # departure_time_route, arrival_time_route, transit_details = get_transport_details(route = route)
-    # print(departure_time_route, arrival_time_route, transit_details, "", sep = "\n")
+    # # 5. Parse the route once: mode, duration, distance, schedule and public transport steps
+    # summary = Parser.parse_route(route[0])
+    # print(summary, "", sep = "\n")
 
-    # # 7. Print all relevant information from the json. It determines what type of transport is being used, and adapt the output
+    # # 6. Print all relevant information from the json. It determines what type of transport is being used, and adapt the output
     information = export_string_route(route = route)
     print(information, "", sep = "\n")
 
@@ -1,25 +1,80 @@
 from selenium import webdriver
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.common.by import By
-import time
+from selenium.common.exceptions import WebDriverException
+from datetime import datetime, timezone
+import threading
+import logging
 import random
-
-
-def return_driver(url: str) -> webdriver.Chrome:
+import queue
+import json
+import time
+import os
+
+# Constants
+PATH = os.path.dirname(os.path.abspath(__file__))
+PATH_OUTPUT = PATH + "/Data/Places"
+WORKERS = 4 # number of browsers visiting the result links concurrently
+DELAY = (2, 5) # politeness delay (min, max) in seconds between two pages loaded by the same browser
+FLUSH_EVERY = 20 # number of records buffered before being written to disk
+MAX_SCROLLS = 200
+STALL_LIMIT = 3 # number of scrolls in a row without new result before giving up
+SCROLL_DELAY = (1, 2) # delay (min, max) in seconds for the results to load after a scroll
+
+# Returns the number of result cards, the links of the cards from index arguments[1] on, and whether the end marker
+# of the list is shown, then scrolls the feed (arguments[0]) to the bottom to load the next results
+COLLECT_SCRIPT = """
+const cards = document.getElementsByClassName('hfpxzc');
+const hrefs = [];
+for (let i = arguments[1]; i < cards.length; i++) {
+    hrefs.push(cards[i].getAttribute('href'));
+}
+const end = document.getElementsByClassName('HlvSq').length > 0;
+arguments[0].scrollTop = arguments[0].scrollHeight;
+return [cards.length, hrefs, end];
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def return_driver(url: str = None, headless: bool = True) -> webdriver.Chrome:
     """
     Initializes a Chrome WebDriver and navigates to the specified URL.
 
     Args:
-    url (str): The URL to navigate to.
+    url (str, optional): The URL to navigate to. Default is None (stay on the blank page).
+    headless (bool, optional): If True, the browser runs without window. Default is True.
 
     Returns:
     webdriver.Chrome: An instance of the Chrome WebDriver.
     """
-    driver = webdriver.Chrome()
-    driver.get(url)
+    options = webdriver.ChromeOptions()
+    if headless:
+        options.add_argument("--headless=new")
+        options.add_argument("--window-size=1280,1024")
+    # Pages are only read: images are not needed
+    options.add_argument("--blink-settings=imagesEnabled=false")
+
+    driver = webdriver.Chrome(options=options)
+    if url:
+        driver.get(url)
     return driver
 
 
+def output_paths(search_key: str) -> tuple:
+    """
+    Returns the paths of the files of a search: the records (JSONL) and the checkpoint of the links to visit.
+
+    Args:
+    search_key (str): The search query.
+
+    Returns:
+    tuple: (records path, links path).
+    """
+    name = '_'.join(search_key.lower().split())
+    return f"{PATH_OUTPUT}/{name}.jsonl", f"{PATH_OUTPUT}/{name}.links.json"
+
+
 def handle_search(driver: webdriver.Chrome, search_key: str):
     """
     Performs a search on Google Maps using the specified search key.
@@ -50,100 +105,272 @@ def return_random_number(lower_limit: int = 2, upper_limit: int = 5) -> int:
     return random.randint(lower_limit, upper_limit)
 
 
-def scroll(scroll_driver: webdriver.Chrome):
+def return_links(driver: webdriver.Chrome, max_scrolls: int = MAX_SCROLLS, stall_limit: int = STALL_LIMIT) -> list:
     """
-    Scrolls the page down using the PAGE_DOWN key.
+    Scrolls through the search results on Google Maps and collects the links. Each scroll is a single script call
+    that returns the links of the result cards that appeared since the previous one, so the cost is linear in the
+    number of results. Scrolling stops at the end of the list, or when it stops growing.
 
     Args:
-    scroll_driver (webdriver.Chrome): The WebDriver instance to interact with.
+    driver (webdriver.Chrome): The WebDriver instance to interact with.
+    max_scrolls (int, optional): The maximum number of scrolls. Default is MAX_SCROLLS.
+    stall_limit (int, optional): The number of scrolls in a row without new result before stopping. Default is STALL_LIMIT.
+
+    Returns:
+    list: A list of unique links to the search results, in the order of the results.
     """
-    scroll_driver.send_keys(Keys.PAGE_DOWN)
+    feed = driver.find_element(By.CSS_SELECTOR, 'div[role="feed"]')
+    links = {}
+    seen = 0
+    stalls = 0
+
+    for _ in range(max_scrolls):
+        count, hrefs, end = driver.execute_script(COLLECT_SCRIPT, feed, seen)
+
+        for href in hrefs:
+            if href:
+                links[href] = None
 
+        stalls = stalls + 1 if count == seen else 0
+        seen = count
 
-def return_links(driver: webdriver.Chrome) -> list:
+        if end or stalls >= stall_limit:
+            break
+
+        time.sleep(random.uniform(*SCROLL_DELAY))
+
+    logger.info("%d links collected from %d results", len(links), seen)
+
+    return list(links)
+
+
+class JsonlWriter:
+    """
+    Single writer of the records of a search, shared by the workers: the file is opened once,
+    and records are written by batches of FLUSH_EVERY lines.
+    """
+
+    def __init__(self, path: str, flush_every: int = FLUSH_EVERY):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, 'a', encoding="utf-8")
+        self.flush_every = flush_every
+        self.buffer = []
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def write(self, record: dict):
+        with self._lock:
+            self.buffer.append(json.dumps(record, ensure_ascii=False) + '\n')
+            self.count += 1
+            if len(self.buffer) >= self.flush_every:
+                self.flush()
+
+    def flush(self):
+        """Writes the buffered records. Must be called while holding the lock (or once the workers are done)."""
+        self.file.writelines(self.buffer)
+        self.file.flush()
+        self.buffer.clear()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_done_links(path: str) -> set:
     """
-    Scrolls through the search results on Google Maps and collects the links.
+    Reads the links already scraped from the records of a previous run (checkpoint).
 
     Args:
-    driver (webdriver.Chrome): The WebDriver instance to interact with.
+    path (str): Path of the records.
 
     Returns:
-    list: A list of unique links to the search results.
+    set: Links already scraped.
     """
-    scroll_div = driver.find_element(By.XPATH, """//*[@id="QA0Szd"]/div/div/div[1]/div[2]/div/div[1]/div/div/div[1]/div[1]""")
-    keep_scrolling = True
-    links = []
+    done = set()
 
-    max_scroll = 1
-    count = 0
-    try:
-        while keep_scrolling:
-            scroll(scroll_div)
-            time.sleep(return_random_number())
+    if not os.path.exists(path):
+        return done
 
+    with open(path, 'r', encoding="utf-8") as read_file:
+        for line in read_file:
             try:
-                driver.find_element(By.CLASS_NAME, "HlvSq")
-                keep_scrolling = False
+                done.add(json.loads(line)["link"])
+            except (ValueError, KeyError):
+                # Last line of a run that crashed while writing
+                continue
 
-            except Exception as exp:
-                print(exp)
-                print('---------------------------------')
-                keep_scrolling = True
+    return done
 
-            links = driver.find_elements(By.CLASS_NAME, "hfpxzc")
-            print(links)
-            if count > max_scroll:
-                keep_scrolling = False
 
-            count += 1
+def scrape_place(driver: webdriver.Chrome, link: str) -> dict:
+    """
+    Scrapes the details of a place.
+
+    Args:
+    driver (webdriver.Chrome): The WebDriver instance to interact with.
+    link (str): The URL of the place.
+
+    Returns:
+    dict: The record of the place: link, name, aria-labels of its details (address, phone...), and time of scraping.
+    """
+    driver.get(link)
+    # One round trip for all the labels instead of one per element
+    labels = driver.execute_script(
+        "return Array.from(document.getElementsByClassName('CsEnBe'), element => element.getAttribute('aria-label'));"
+    )
+
+    return {
+        "link": link,
+        "name": driver.title.removesuffix(" - Google Maps"),
+        "labels": [label.strip() for label in labels if label],
+        "scraped_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def quit_driver(driver: webdriver.Chrome):
+    """
+    Closes a browser, without raising if it already crashed.
+
+    Args:
+    driver (webdriver.Chrome): The browser to close.
+    """
+    try:
+        driver.quit()
     except Exception as exp:
-        print(exp)
+        logger.debug("Could not quit the browser: %r", exp)
 
-    return list(set([link.get_attribute("href") for link in links if link.get_attribute("href") is not None]))
 
+def scrape_worker(links: queue.Queue, writer: JsonlWriter, delay: tuple = DELAY, headless: bool = True):
+    """
+    Visits links from the queue until it is empty, with its own browser (reused for all its links),
+    waiting between delay[0] and delay[1] seconds between two pages. A link that fails is logged and skipped:
+    one bad page never stops the pool.
+
+    Args:
+    links (queue.Queue): The links to visit, shared by the workers.
+    writer (JsonlWriter): The writer of the records, shared by the workers.
+    delay (tuple, optional): The politeness delay (min, max) in seconds. Default is DELAY.
+    headless (bool, optional): If True, the browser runs without window. Default is True.
+    """
+    driver = None
 
-def scrape_data(driver: webdriver.Chrome, links: list, search_key: str):
+    try:
+        while True:
+            try:
+                link = links.get_nowait()
+            except queue.Empty:
+                return
+
+            if driver is None:
+                try:
+                    driver = return_driver(headless=headless)
+                except Exception:
+                    # This worker cannot browse: the link is left to the other workers
+                    logger.exception("Could not start a browser, stopping this worker")
+                    links.put(link)
+                    return
+
+            # The links not recorded are retried by the next run
+            try:
+                writer.write(scrape_place(driver, link))
+            except WebDriverException as exp:
+                # The browser may have crashed: it is replaced
+                logger.warning("Could not scrape %s: %s", link, exp.msg)
+                quit_driver(driver)
+                driver = None
+            except Exception:
+                logger.exception("Could not scrape %s", link)
+
+            time.sleep(random.uniform(*delay))
+    finally:
+        if driver is not None:
+            quit_driver(driver)
+
+
+def scrape_data(links: list, search_key: str, workers: int = WORKERS, delay: tuple = DELAY, headless: bool = True) -> int:
     """
-    Scrapes data from the provided list of links and writes it to a text file.
+    Scrapes data from the provided list of links with a pool of browsers, and appends it to the records of the search
+    (one JSON object per line). Links already in the records are skipped, so an interrupted run can be resumed.
 
     Args:
-    driver (webdriver.Chrome): The WebDriver instance to interact with.
     links (list): A list of URLs to scrape data from.
     search_key (str): The search key used to name the output file.
+    workers (int, optional): The number of browsers. Default is WORKERS.
+    delay (tuple, optional): The politeness delay (min, max) in seconds of each browser. Default is DELAY.
+    headless (bool, optional): If True, the browsers run without window. Default is True.
+
+    Returns:
+    int: The number of places scraped.
     """
-    for link in links:
-        driver.get(link)
-        class_ = driver.find_elements(By.CLASS_NAME, "CsEnBe")
-        with open('_'.join(search_key.split(' ')) + '.txt', 'a', encoding="utf-8") as write_file:
-            for classs in class_:
-                arie_label = classs.get_attribute("aria-label")
-                write_file.write(arie_label)
-                write_file.write('\n')
-            write_file.write('-' * 100)
+    path, _ = output_paths(search_key)
+    done = load_done_links(path)
+
+    pending = queue.Queue()
+    for link in dict.fromkeys(links):
+        if link not in done:
+            pending.put(link)
+
+    logger.info("%d links to scrape, %d already done", pending.qsize(), len(done))
 
-        time.sleep(return_random_number())
+    with JsonlWriter(path) as writer:
+        threads = [
+            threading.Thread(target=scrape_worker, args=(pending, writer, delay, headless), daemon=True)
+            for _ in range(min(workers, pending.qsize()))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
+        return writer.count
 
-def main(url: str, search_key: str):
+
+def main(url: str, search_key: str, workers: int = WORKERS, headless: bool = True, resume: bool = True) -> int:
     """
     Main function to execute the web scraping process.
 
     Args:
     url (str): The URL to navigate to (Google Maps).
     search_key (str): The search query to input into Google Maps.
+    workers (int, optional): The number of browsers visiting the results. Default is WORKERS.
+    headless (bool, optional): If True, the browsers run without window. Default is True.
+    resume (bool, optional): If True, the links collected by a previous run are reused. Default is True.
+
+    Returns:
+    int: The number of places scraped.
     """
-    driver = return_driver(url)
+    _, links_path = output_paths(search_key)
 
-    handle_search(driver, search_key)
+    if resume and os.path.exists(links_path):
+        with open(links_path, 'r', encoding="utf-8") as read_file:
+            links = json.load(read_file)
 
-    time.sleep(return_random_number())
+    else:
+        driver = return_driver(url, headless=headless)
+        try:
+            handle_search(driver, search_key)
+            time.sleep(return_random_number())
+            links = return_links(driver)
+        finally:
+            driver.quit()
 
-    links = return_links(driver)
+        # Checkpoint: the search is not done again if the scraping is interrupted
+        os.makedirs(PATH_OUTPUT, exist_ok=True)
+        with open(links_path, 'w', encoding="utf-8") as write_file:
+            json.dump(links, write_file)
 
-    scrape_data(driver, links, search_key)
+    return scrape_data(links, search_key, workers=workers, headless=headless)
 
 
 if __name__ == '__main__':
     url = 'https://www.google.com/maps'
     search_key = 'School near me'
+    logging.basicConfig(level=logging.INFO)
     main(url, search_key)
@@ -1,34 +1,31 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 
-import requests
 import json
 import sys
 import os
 
-# Needed to import Utils/setting.py
+# Needed to import Transport/Stationboard.py when run as a script
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Utils import settings
+from Transport import Stationboard
 
 # print(os.path.dirname(os.path.abspath(__file__)))
 
 
-def get_json_file(station:str, limit:int=5, base_url=settings.get_parameter("URL_SBB")) -> json:
+def get_json_file(station:str, limit:int=5, base_url=None) -> json:
     """Requests the SBB API to get informations about the next departures from the specified stop.
+    Responses are shared between users for a few seconds (see Stationboard.py).
 
     Args:
         station (str): station stop of interest.
         limit (int, optional): max number of departures to return. Defaults to 5.
-        base_url (_type_, optional): API enter point. Defaults to settings.get_parameter("URL_SBB").
+        base_url (str, optional): API enter point. Defaults to None (settings.get_parameter("URL_SBB")).
 
     Returns:
         json: SBB API request result.
     """
 
-    url = f"{base_url}station={station}&limit={str(limit)}"
-    r = requests.get(url)
-    json_file = r.json()
-
-    return json_file
+    return Stationboard.get_stationboard(station=station, limit=limit, base_url=base_url)
 
 def get_coordinates(request):
     """Uses the transport API to get the station coodrinates. 
@@ -44,47 +41,86 @@ def get_coordinates(request):
     return lat, lon
 
 
-def get_next_departures(request: json):
-    """Get some information about the next departures at a given station.
-    Returns a list of dictionnary with the elements:
-    ['starting_stop', 'starting_time', 'starting_time_format', 'delay', 'arrival_stop', 'transport_type']
-    """
+# Parsed UTC offsets, e.g. "+0200" -> timezone(timedelta(hours=2))
+_TIMEZONES = {}
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parses the ISO-8601 timestamps of the API ("2024-08-24T10:10:00+0200") by slicing, much faster than strptime.
+    Other formats fall back on datetime.fromisoformat."""
+
+    try:
+        offset = timestamp[19:]
+        tz = _TIMEZONES.get(offset)
+
+        if tz is None:
+            minutes = int(offset[1:3]) * 60 + int(offset[-2:])
+            tz = _TIMEZONES[offset] = timezone(timedelta(minutes=-minutes if offset[0] == "-" else minutes))
+
+        return datetime(int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]), int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]), tzinfo=tz)
+
+    except (ValueError, IndexError):
+        return datetime.fromisoformat(timestamp)
 
-    departures = request["stationboard"]
 
-    list_departures = list()
+class Departure:
+    """Next departure at a given station. The departure time is only parsed when starting_time is read."""
 
-    for depart in departures:
+    __slots__ = ("starting_stop", "departure", "delay", "arrival_stop", "transport_type", "_starting_time")
 
-        starting_stop = depart["stop"]["station"]["name"]
-        starting_time = datetime.strptime(depart["stop"]["departure"], "%Y-%m-%dT%H:%M:%S%z")
-        delay = depart["stop"]["delay"]
-        arrival_stop = depart["to"]
-        transport_type = depart["number"]
+    def __init__(self, starting_stop: str, departure: str, delay: int, arrival_stop: str, transport_type: str):
+        self.starting_stop = starting_stop
+        self.departure = departure # raw ISO-8601 timestamp
+        self.delay = delay
+        self.arrival_stop = arrival_stop
+        self.transport_type = transport_type
+        self._starting_time = None
 
-        starting_time_format = starting_time.strftime("%H:%M")
+    @classmethod
+    def from_json(cls, depart: dict):
+        stop = depart["stop"]
+        return cls(stop["station"]["name"], stop["departure"], stop["delay"], depart["to"], depart["number"])
 
-        dic_res = {
-            "starting_stop": starting_stop,
-            "starting_time": starting_time,
-            "starting_time_format": starting_time_format,
-            "delay": delay,
-            "arrival_stop": arrival_stop,
-            "transport_type": transport_type
-            }
-        list_departures.append(dic_res.copy())
+    @property
+    def starting_time(self) -> datetime:
+        if self._starting_time is None:
+            self._starting_time = parse_timestamp(self.departure)
+        return self._starting_time
+
+    @property
+    def starting_time_format(self) -> str:
+        """Departure time as HH:MM, read from the raw timestamp when possible."""
+        if len(self.departure) >= 16 and self.departure[13] == ":":
+            return self.departure[11:16]
+        return self.starting_time.strftime("%H:%M")
+
+    def __repr__(self):
+        return f"Departure({self.transport_type} to {self.arrival_stop} at {self.departure}, +{self.delay}min)"
+
+
+def iter_departures(request: json):
+    """Lazily yields the next departures at a given station (see Departure), one stationboard entry at a time."""
+
+    for depart in request["stationboard"]:
+        yield Departure.from_json(depart)
+
+
+def get_next_departures(request: json) -> list:
+    """Get some information about the next departures at a given station.
+    Returns a list of Departure with the attributes:
+    ['starting_stop', 'starting_time', 'starting_time_format', 'delay', 'arrival_stop', 'transport_type']
+    """
 
-    return list_departures
+    return list(iter_departures(request))
 
-def export_string_sbb(station:str, limit:int=5, base_url=settings.get_parameter("URL_SBB")):
+def export_string_sbb(station:str, limit:int=5, base_url=None):
 
     json_file = get_json_file(station=station, limit=limit, base_url=base_url)
 
-    list_departures = get_next_departures(request=json_file)
     start = json_file["station"]["name"]
 
     out = f"🚉 Soon leaving from from {start}:\n"
-    departure = [" - {} to {}: {} (+{}min).".format(list_departures[i]["transport_type"], list_departures[i]["arrival_stop"], list_departures[i]["starting_time_format"], list_departures[i]["delay"]) for i in range(len(list_departures))]
+    departure = [f" - {depart.transport_type} to {depart.arrival_stop}: {depart.starting_time_format} (+{depart.delay}min)." for depart in islice(iter_departures(json_file), limit)]
 
     out = out + "\n".join(departure)
 
@@ -98,7 +134,7 @@ if __name__ == "__main__":
     lat, lon = get_coordinates(json_file)
 
 
-    res = get_next_departures(json_file)[1].keys()
+    res = get_next_departures(json_file)[1]
 
     print(export_string_sbb("figuiers"))
     
@@ -0,0 +1,125 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+import threading
+import requests
+import time
+import sys
+import os
+
+# Needed to import Utils/setting.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils import settings
+
+# Constants
+TTL = 25 # in seconds, a stationboard younger than this is served as is
+MAX_STALE = 120 # in seconds, a stationboard younger than this is served while being refreshed in the background
+REQUEST_TIMEOUT = 10 # in seconds
+
+# Keep-alive connections shared by all requests
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=2, pool_maxsize=16))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=2, pool_maxsize=16))
+
+_REFRESHER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="stationboard-refresh")
+
+_LOCK = threading.Lock()
+_CACHE = {} # ((base url, station), limit) -> (fetch timestamp, stationboard)
+_IN_FLIGHT = {} # ((base url, station), limit) -> Future of the stationboard being fetched
+
+
+def fetch_stationboard(station: str, limit: int, base_url: str = None) -> dict:
+    """Requests the SBB API (without cache) to get the next departures from the specified stop."""
+
+    if base_url is None:
+        base_url = settings.get_parameter("URL_SBB")
+
+    r = _SESSION.get(base_url, params={"station": station, "limit": limit}, timeout=REQUEST_TIMEOUT)
+    r.raise_for_status()
+
+    return r.json()
+
+
+def _trim(stationboard: dict, limit: int) -> dict:
+    """Returns the stationboard with at most limit departures. The cached stationboard is not modified."""
+    if len(stationboard.get("stationboard", [])) <= limit:
+        return stationboard
+    return dict(stationboard, stationboard=stationboard["stationboard"][:limit])
+
+
+def _find(station: tuple, limit: int, max_age: float, now: float):
+    """Returns the key of the cached stationboard of the (base url, station) with the smallest limit >= limit, younger than max_age."""
+    keys = [key for key, (fetched, _) in _CACHE.items() if key[0] == station and key[1] >= limit and now - fetched < max_age]
+    return min(keys, key=lambda key: key[1]) if keys else None
+
+
+def _fetch(key: tuple, station: str, base_url: str, future: Future):
+    """Fetches a stationboard, stores it and resolves the future of the request."""
+    try:
+        stationboard = fetch_stationboard(station, key[1], base_url)
+    except Exception as exp:
+        with _LOCK:
+            _IN_FLIGHT.pop(key, None)
+        future.set_exception(exp)
+        return
+
+    with _LOCK:
+        _CACHE[key] = (time.time(), stationboard)
+        _IN_FLIGHT.pop(key, None)
+
+        # Drop the stationboards too old to be served
+        for old in [old for old, (fetched, _) in _CACHE.items() if time.time() - fetched >= MAX_STALE]:
+            del _CACHE[old]
+
+    future.set_result(stationboard)
+
+
+def get_stationboard(station: str, limit: int = 5, base_url: str = None) -> dict:
+    """Returns the next departures from a stop, served from a short-lived cache shared by all users.
+
+    - a fresh stationboard (younger than TTL) with at least limit departures is served directly;
+    - a stale one (younger than MAX_STALE) is served while a single background request refreshes it;
+    - otherwise, the request joins the identical request in flight, if any, or fetches the stationboard.
+
+    Args:
+        station (str): station stop of interest.
+        limit (int, optional): max number of departures to return. Defaults to 5.
+        base_url (str, optional): API enter point. Defaults to None (settings.get_parameter("URL_SBB")).
+
+    Returns:
+        dict: SBB API request result.
+    """
+    if base_url is None:
+        base_url = settings.get_parameter("URL_SBB")
+
+    # Stationboards of different endpoints (e.g. a stand-in and the real API) are never mixed
+    key = ((base_url, station.strip().lower()), int(limit))
+    now = time.time()
+    refresh, owner = None, False
+
+    with _LOCK:
+        fresh = _find(key[0], key[1], TTL, now)
+        if fresh:
+            return _trim(_CACHE[fresh][1], key[1])
+
+        in_flight = [other for other in _IN_FLIGHT if other[0] == key[0] and other[1] >= key[1]]
+        stale = _find(key[0], key[1], MAX_STALE, now)
+
+        if stale:
+            if not in_flight:
+                refresh = _IN_FLIGHT[stale] = Future()
+            stationboard = _CACHE[stale][1]
+        elif in_flight:
+            future = _IN_FLIGHT[min(in_flight, key=lambda other: other[1])]
+        else:
+            future = _IN_FLIGHT[key] = Future()
+            owner = True
+
+    if stale:
+        if refresh:
+            _REFRESHER.submit(_fetch, stale, station, base_url, refresh)
+        return _trim(stationboard, key[1])
+
+    if owner:
+        _fetch(key, station, base_url, future)
+
+    return _trim(future.result(), key[1])
@@ -0,0 +1,58 @@
+from datetime import datetime, date, tzinfo
+from zoneinfo import ZoneInfo
+
+from Utils import settings
+
+# Constants
+DEFAULT_TIMEZONE = "Europe/Zurich" # used when the settings have no "TIMEZONE"
+
+
+def get_timezone() -> tzinfo:
+    """Timezone of the events and of the times shown to the users, the "TIMEZONE" setting."""
+    return ZoneInfo(settings.get_snapshot().data.get("TIMEZONE") or DEFAULT_TIMEZONE)
+
+
+class Clock:
+    """Gives the current time. Unlike a value computed at import, it rolls over at midnight in a long-running bot."""
+
+    def __init__(self, tz: tzinfo = None):
+        self.tz = tz
+
+    def now(self) -> datetime:
+        """Current datetime, in the configured timezone (see get_timezone) if no timezone was given."""
+        return datetime.now(self.tz or get_timezone())
+
+    def today(self) -> date:
+        return self.now().date()
+
+
+class FixedClock(Clock):
+    """Clock frozen at a given datetime, for simulations and benchmarks."""
+
+    def __init__(self, frozen: datetime):
+        super().__init__(tz=frozen.tzinfo)
+        self.frozen = frozen
+
+    def now(self) -> datetime:
+        return self.frozen
+
+
+_CLOCK = Clock()
+
+
+def get_clock() -> Clock:
+    return _CLOCK
+
+
+def set_clock(clock: Clock):
+    """Replaces the clock used by all the modules."""
+    global _CLOCK
+    _CLOCK = clock
+
+
+def now() -> datetime:
+    return _CLOCK.now()
+
+
+def today() -> date:
+    return _CLOCK.today()
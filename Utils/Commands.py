@@ -0,0 +1,105 @@
+from typing import NamedTuple
+import logging
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from Utils.Execution import CommandTimeout
+from Utils import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Command(NamedTuple):
+    """A command of the bot. The handler is called as handler(update, context, args)."""
+    name: str
+    handler: callable
+    aliases: tuple
+    description: str
+
+
+# Maps every normalised keyword (name and aliases) to its command
+_REGISTRY = {}
+
+
+def normalize(text: str) -> str:
+    """Lower-cases the text and collapses the whitespaces: "  Calendar   LIST " -> "calendar list"."""
+    return " ".join(text.lower().split())
+
+
+def register(name: str, *aliases: str, description: str = ""):
+    """Decorator registering an async handler under a keyword and its aliases.
+
+    Args:
+        name (str): main keyword of the command, also used as name in the metrics and timeouts.
+        aliases (str): other keywords triggering the command.
+        description (str, optional): short description of the command. Defaults to "".
+    """
+    def decorator(handler):
+        command = Command(name=normalize(name), handler=handler, aliases=tuple(normalize(alias) for alias in aliases), description=description)
+
+        for keyword in (command.name,) + command.aliases:
+            if keyword in _REGISTRY:
+                raise ValueError(f"Keyword {keyword!r} is already used by command {_REGISTRY[keyword].name!r}")
+            _REGISTRY[keyword] = command
+
+        return handler
+
+    return decorator
+
+
+def resolve(text: str) -> tuple:
+    """Finds the command matching the text. The longest keyword prefix wins, the remaining words are the arguments.
+    "calendar list" -> (calendar list, []), "calendar 3" -> (calendar, ["3"]).
+
+    Returns:
+        tuple: (Command, list of arguments) or (None, []) if no command matches.
+    """
+    words = normalize(text).split(" ")
+
+    for i in range(len(words), 0, -1):
+        command = _REGISTRY.get(" ".join(words[:i]))
+        if command:
+            return command, words[i:]
+
+    return None, []
+
+
+def list_commands() -> list:
+    """Returns the registered commands, without duplicates."""
+    return list({command.name: command for command in _REGISTRY.values()}.values())
+
+
+async def dispatch(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+    """Runs the command matching the message, recording its latency, errors and upstream time.
+
+    Returns:
+        bool: True if a command matched the message.
+    """
+    command, args = resolve(update.message.text)
+
+    if command is None:
+        return False
+
+    metrics = Metrics.get_metrics(command.name)
+    token = Metrics.start_upstream_accounting()
+    error, timeout = False, False
+
+    try:
+        with Metrics.Timer() as timer:
+            await command.handler(update, context, args)
+
+    except CommandTimeout as exp:
+        timeout = True
+        await update.message.reply_text(f"⏳ Sorry, the {exp.command!r} request took too long. Please try again later.")
+
+    except Exception:
+        error = True
+        raise
+
+    finally:
+        upstream = Metrics.stop_upstream_accounting(token)
+        metrics.record(timer.elapsed, upstream, error=error, timeout=timeout)
+        logger.info("%s handled in %.0fms (upstream %.0fms)", command.name, timer.elapsed * 1000, upstream * 1000)
+
+    return True
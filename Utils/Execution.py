@@ -0,0 +1,79 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from Utils import Metrics
+
+logger = logging.getLogger(__name__)
+
+# Constants
+MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 30 # in seconds
+COMMAND_TIMEOUTS = {
+    "weather": 20,
+    "transport": 10,
+    "calendar": 60,
+    "calendar list": 45,
+    "plan": 60,
+    "near": 30,
+}
+
+# Bounded pool shared by every blocking command (requests, gcsa, googlemaps, ...)
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="oscar-worker")
+
+
+class CommandTimeout(Exception):
+    """Raised when a command did not complete within its time budget."""
+
+    def __init__(self, command: str, timeout: float):
+        super().__init__(f"Command {command!r} did not complete within {timeout}s")
+        self.command = command
+        self.timeout = timeout
+
+
+def get_timeout(command: str) -> float:
+    """Returns the time budget (in seconds) of a command, DEFAULT_TIMEOUT if not specified."""
+    return COMMAND_TIMEOUTS.get(command, DEFAULT_TIMEOUT)
+
+
+async def run_blocking(func, *args, command: str = None, timeout: float = None, **kwargs):
+    """Runs a blocking function in the worker pool without blocking the Telegram event loop.
+
+    If the function does not return within the time budget, the awaiting handler is released and the
+    work is cancelled: a job still waiting in the pool queue is dropped, a running one is left to finish
+    in the background (threads cannot be interrupted) and its result is discarded.
+    The time spent waiting on the function is added to the upstream time of the command being handled.
+
+    Args:
+        func (callable): blocking function to execute.
+        command (str, optional): name of the command, used to look up its time budget. Defaults to None.
+        timeout (float, optional): time budget in seconds, overrides the command one. Defaults to None.
+
+    Raises:
+        CommandTimeout: the function did not return in time.
+
+    Returns:
+        the value returned by func.
+    """
+    if timeout is None:
+        timeout = get_timeout(command)
+
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(_EXECUTOR, functools.partial(func, *args, **kwargs))
+
+    timer = Metrics.Timer()
+
+    try:
+        with timer:
+            return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Command %r cancelled after %ss", command or func.__name__, timeout)
+        raise CommandTimeout(command or func.__name__, timeout)
+    finally:
+        Metrics.record_upstream(timer.elapsed)
+
+
+def shutdown(wait: bool = False):
+    """Stops the worker pool, dropping the jobs that did not start yet."""
+    _EXECUTOR.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,104 @@
+from collections import deque
+import contextvars
+import threading
+import time
+
+# Constants
+WINDOW = 1000 # number of latencies kept per command
+
+# Upstream time accumulated by the command currently being handled (see Utils.Execution.run_blocking)
+_UPSTREAM = contextvars.ContextVar("upstream", default=None)
+
+
+class CommandMetrics:
+    """Latency and error accounting of a single command, over the last WINDOW calls."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.total_time = 0.
+        self.upstream_time = 0.
+        self.latencies = deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, upstream: float, error: bool = False, timeout: bool = False):
+        with self._lock:
+            self.count += 1
+            self.errors += error
+            self.timeouts += timeout
+            self.total_time += elapsed
+            self.upstream_time += upstream
+            self.latencies.append(elapsed)
+
+    def percentiles(self, *quantiles: float) -> list:
+        """Returns the requested latency percentiles (in seconds), e.g. percentiles(50, 95, 99)."""
+        with self._lock:
+            latencies = sorted(self.latencies)
+
+        if not latencies:
+            return [0. for _ in quantiles]
+
+        return [latencies[min(len(latencies) - 1, int(len(latencies) * q / 100))] for q in quantiles]
+
+    def upstream_share(self) -> float:
+        """Fraction of the handling time spent waiting on blocking upstream calls."""
+        return self.upstream_time / self.total_time if self.total_time else 0.
+
+    def summary(self) -> str:
+        p50, p95, p99 = self.percentiles(50, 95, 99)
+        return (f"{self.name}: {self.count} calls, {self.errors} errors, {self.timeouts} timeouts | "
+                f"p50 {p50 * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms, p99 {p99 * 1000:.0f}ms | "
+                f"upstream {self.upstream_share():.0%}")
+
+
+_METRICS = {}
+_LOCK = threading.Lock()
+
+
+def get_metrics(name: str) -> CommandMetrics:
+    """Returns the metrics of a command, creating them on first use."""
+    metrics = _METRICS.get(name)
+
+    if metrics is None:
+        with _LOCK:
+            metrics = _METRICS.setdefault(name, CommandMetrics(name))
+
+    return metrics
+
+
+def all_metrics() -> list:
+    return [_METRICS[name] for name in sorted(_METRICS)]
+
+
+def start_upstream_accounting():
+    """Starts accumulating the upstream time of the current command. Returns a token for stop_upstream_accounting."""
+    return _UPSTREAM.set([0.])
+
+
+def stop_upstream_accounting(token) -> float:
+    """Stops the accounting started with start_upstream_accounting and returns the upstream time in seconds."""
+    upstream = _UPSTREAM.get()
+    _UPSTREAM.reset(token)
+    return upstream[0] if upstream else 0.
+
+
+def record_upstream(elapsed: float):
+    """Adds some upstream time to the command currently being handled (no-op outside a command)."""
+    upstream = _UPSTREAM.get()
+    if upstream is not None:
+        upstream[0] += elapsed
+
+
+class Timer:
+    """Context manager measuring the elapsed time of a block, in seconds."""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.elapsed = 0.
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+        return False
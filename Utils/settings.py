@@ -1,20 +1,111 @@
+from typing import NamedTuple
+import threading
 import json
 import os
 
 PATH_SETTINGS = os.path.dirname(os.path.abspath(__file__)) + '/settings.json'
 
-def get_parameter(param:str) -> str:
-    
-    if not os.path.exists(PATH_SETTINGS):
-        raise FileNotFoundError(f"{PATH_SETTINGS!r} file not found")
-    
+
+class UserProfile(NamedTuple):
+    """Typed view of a user entry of the settings file."""
+    id: str
+    lat: float
+    lon: float
+    stop: str
+    calendars: dict
+
+
+class Snapshot(NamedTuple):
+    """Parsed content of the settings file at a given version (mtime, size) of the file."""
+    version: tuple
+    data: dict
+    users: dict
+
+
+_LOCK = threading.Lock()
+_SNAPSHOT = None
+
+
+def _parse_user(key: str, entry: dict, default_stop: str) -> UserProfile:
+    """Builds the profile of a user from its entry in the settings file."""
+    coordinates = entry.get("COORDINATES", {})
+
+    return UserProfile(
+        id=str(entry.get("ID", key)),
+        lat=float(coordinates.get("LAT", 0)),
+        lon=float(coordinates.get("LON", 0)),
+        stop=entry.get("STOP", default_stop),
+        calendars=entry.get("CALENDARS", {}),
+    )
+
+
+def _load(version: tuple) -> Snapshot:
+    """Reads and parses the settings file."""
     with open(PATH_SETTINGS, 'r') as f:
         data = json.load(f)
-    
-    if str(param) in list(data.keys()):
+
+    default_stop = data.get("SBB_STARTING_STOP")
+    users = {str(key): _parse_user(key, entry, default_stop) for key, entry in data.items() if isinstance(entry, dict) and "COORDINATES" in entry}
+
+    return Snapshot(version=version, data=data, users=users)
+
+
+def get_snapshot() -> Snapshot:
+    """Returns the current content of the settings file. The file is only parsed again when its mtime or size changed.
+    A snapshot is never modified once built: use a single snapshot to read several values consistently."""
+    global _SNAPSHOT
+
+    try:
+        stat = os.stat(PATH_SETTINGS)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"{PATH_SETTINGS!r} file not found")
+
+    version = (stat.st_mtime_ns, stat.st_size)
+    snapshot = _SNAPSHOT
+
+    if snapshot is None or snapshot.version != version:
+        with _LOCK:
+            # Another thread may have reloaded the file in the meantime
+            if _SNAPSHOT is None or _SNAPSHOT.version != version:
+                _SNAPSHOT = _load(version)
+            snapshot = _SNAPSHOT
+
+    return snapshot
+
+
+def get_parameter(param:str) -> str:
+
+    data = get_snapshot().data
+
+    if str(param) in data:
         return data[str(param)]
     else:
         raise KeyError(f"[{__name__}] Parameter {param!r} not found in 'settings.json' file")
-    
+
+
+def get_user(user_id: str = None, fallback: bool = True) -> UserProfile:
+    """Returns the profile of a user.
+
+    Args:
+        user_id (str, optional): user id (telegram identifier). Defaults to None (main user).
+        fallback (bool, optional): if True, the main user (ID_MAIN) is returned when the user is unknown. Defaults to True.
+
+    Raises:
+        KeyError: the user (or the main user) is not in the settings file.
+
+    Returns:
+        UserProfile: profile of the user.
+    """
+    snapshot = get_snapshot()
+
+    if user_id is not None and str(user_id) in snapshot.users:
+        return snapshot.users[str(user_id)]
+
+    if fallback and str(snapshot.data.get("ID_MAIN")) in snapshot.users:
+        return snapshot.users[str(snapshot.data["ID_MAIN"])]
+
+    raise KeyError(f"[{__name__}] User {user_id!r} not found in 'settings.json' file")
+
+
 if __name__ == "__main__":
-    print(get_parameter("URL_OPEN_METEO"))
\ No newline at end of file
+    print(get_parameter("URL_OPEN_METEO"))
@@ -0,0 +1,166 @@
+from concurrent.futures import Future
+import openmeteo_requests
+import threading
+import requests
+import time
+import math
+import os
+import sys
+import pandas as pd
+from retry_requests import retry
+
+# Needed to import Utils/setting.py
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Utils import settings
+
+# Constants
+GRID_STEP = 0.02 # in degrees (~2km), overridden by WEATHER_GRID_STEP in settings.json
+MODEL_UPDATE_INTERVAL = 3600 # in seconds, Open-Meteo refreshes its forecasts every hour
+MAX_LOCATIONS_PER_REQUEST = 100
+
+# Make sure all required weather variables are listed here
+# The order of variables in hourly or daily is important to assign them correctly in process_response
+PARAMS = {
+    "current": ["temperature_2m", "apparent_temperature", "precipitation", "weather_code", "cloud_cover", "wind_speed_10m"],
+    "hourly": ["temperature_2m", "relative_humidity_2m", "precipitation", "weather_code", "cloud_cover", "uv_index", "is_day"],
+    "daily": ["weather_code", "temperature_2m_max", "temperature_2m_min", "uv_index_max", "precipitation_sum", "precipitation_hours"],
+    "timezone": "Europe/Berlin",
+    "forecast_days": 4
+}
+
+# Setup the Open-Meteo API client with retry on error, shared by all requests
+_CLIENT = openmeteo_requests.Client(session=retry(requests.Session(), retries=5, backoff_factor=0.2))
+
+_LOCK = threading.Lock()
+_CACHE = {} # cell -> (expiry timestamp, (hourly dataframe, daily dataframe))
+_IN_FLIGHT = {} # cell -> Future of the forecast being fetched
+
+
+def get_grid_step() -> float:
+    return float(settings.get_snapshot().data.get("WEATHER_GRID_STEP", GRID_STEP))
+
+
+def to_cell(lat: float, lon: float, step: float = None) -> tuple:
+    """Snaps coordinates to the center of their grid cell. Users in the same cell share the same forecast.
+
+    Returns:
+        tuple: (lat, lon) of the cell center.
+    """
+    step = step or get_grid_step()
+    return round(round(float(lat) / step) * step, 5), round(round(float(lon) / step) * step, 5)
+
+
+def next_model_update(now: float = None) -> float:
+    """Returns the timestamp of the next model update, at which cached forecasts expire."""
+    now = time.time() if now is None else now
+    return (math.floor(now / MODEL_UPDATE_INTERVAL) + 1) * MODEL_UPDATE_INTERVAL
+
+
+def _to_dataframe(variables, names: list) -> pd.DataFrame:
+    """Converts hourly or daily Open-Meteo variables to a dataframe. The order of names needs to be the same as requested."""
+
+    data = {"date": pd.date_range(
+        start = pd.to_datetime(variables.Time(), unit = "s", utc = True),
+        end = pd.to_datetime(variables.TimeEnd(), unit = "s", utc = True),
+        freq = pd.Timedelta(seconds = variables.Interval()),
+        inclusive = "left"
+    )}
+
+    for i, name in enumerate(names):
+        data[name] = variables.Variables(i).ValuesAsNumpy()
+
+    return pd.DataFrame(data = data)
+
+
+def process_response(response) -> tuple:
+    """Converts the response of one location to a tuple of dataframes, respectively for hourly and daily info."""
+    return _to_dataframe(response.Hourly(), PARAMS["hourly"]), _to_dataframe(response.Daily(), PARAMS["daily"])
+
+
+def fetch_forecasts(cells: list) -> list:
+    """Requests the Open-Meteo API for several locations at once (one request per MAX_LOCATIONS_PER_REQUEST cells).
+
+    Args:
+        cells (list): list of (lat, lon).
+
+    Returns:
+        list: tuple (hourly dataframe, daily dataframe) of each cell, in the same order.
+    """
+    url = settings.get_parameter("URL_OPEN_METEO")
+    forecasts = []
+
+    for i in range(0, len(cells), MAX_LOCATIONS_PER_REQUEST):
+        batch = cells[i:i + MAX_LOCATIONS_PER_REQUEST]
+        params = dict(PARAMS, latitude=[lat for lat, _ in batch], longitude=[lon for _, lon in batch])
+
+        # The API returns one response per location, in the requested order
+        responses = _CLIENT.weather_api(url, params=params)
+        forecasts.extend(process_response(response) for response in responses)
+
+    return forecasts
+
+
+def get_forecasts(coordinates: list) -> list:
+    """Returns the forecast of each location. Locations are snapped to the grid; cells with a valid cached forecast
+    are served from memory, cells already being fetched by another thread are awaited, and all the other cells
+    are fetched together in a single multi-location request.
+
+    Args:
+        coordinates (list): list of (lat, lon).
+
+    Returns:
+        list: tuple (hourly dataframe, daily dataframe) of each location, in the same order.
+    """
+    cells = [to_cell(lat, lon) for lat, lon in coordinates]
+    now = time.time()
+    results, waiting, missing = {}, {}, []
+
+    with _LOCK:
+        for cell in dict.fromkeys(cells):
+            cached = _CACHE.get(cell)
+            if cached and cached[0] > now:
+                results[cell] = cached[1]
+            elif cell in _IN_FLIGHT:
+                waiting[cell] = _IN_FLIGHT[cell]
+            else:
+                _IN_FLIGHT[cell] = Future()
+                missing.append(cell)
+
+    if missing:
+        try:
+            forecasts = fetch_forecasts(missing)
+            # A short answer would leave the futures of the last cells pending forever
+            if len(forecasts) != len(missing):
+                raise ValueError(f"Open-Meteo returned {len(forecasts)} forecasts for {len(missing)} locations")
+        except Exception as exp:
+            with _LOCK:
+                for cell in missing:
+                    _IN_FLIGHT.pop(cell).set_exception(exp)
+            raise
+
+        expiry = next_model_update()
+        with _LOCK:
+            for cell, forecast in zip(missing, forecasts):
+                _CACHE[cell] = (expiry, forecast)
+                _IN_FLIGHT.pop(cell).set_result(forecast)
+                results[cell] = forecast
+
+        clear_expired()
+
+    for cell, future in waiting.items():
+        results[cell] = future.result()
+
+    return [results[cell] for cell in cells]
+
+
+def get_forecast(lat: float, lon: float) -> tuple:
+    """Returns the forecast (hourly dataframe, daily dataframe) of a single location."""
+    return get_forecasts([(lat, lon)])[0]
+
+
+def clear_expired():
+    """Drops the forecasts that expired."""
+    now = time.time()
+    with _LOCK:
+        for cell in [cell for cell, (expiry, _) in _CACHE.items() if expiry <= now]:
+            del _CACHE[cell]
@@ -1,22 +1,34 @@
-import openmeteo_requests
-import requests_cache
 import json
+import logging
+import threading
 import os
 import sys
 import pandas as pd
-from retry_requests import retry
+import numpy as np
 
 # Needed to import Utils/setting.py
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from Utils import settings
+from Utils import settings, Clock
 
-TODAY = pd.Timestamp('today').normalize() #+ datetime.timedelta(days=1)
+# When run as a script, 'Weather' resolves to this file instead of the package
+if __package__:
+    from Weather import Forecast
+else:
+    import Forecast
+
+PATH_WEATHER_CODES = os.path.dirname(os.path.abspath(__file__)) + "/weather_code.json"
+EPISODE_DTYPE = np.dtype([("location", np.int64), ("start", np.int64), ("end", np.int64), ("total", np.float64), ("peak", np.float64), ("code", np.int64), ("is_day", bool)])
+
+logger = logging.getLogger(__name__)
+
+_SUMMARIES = {} # user id -> (day, summary of the day)
+_SUMMARIES_LOCK = threading.Lock()
 
 
 def get_data(id_user:str =None):
-    """Requests the Open-Meteo API to extract informations, based on the user's location. 
+    """Returns the Open-Meteo forecast at the user's location.
     The location is specified in setting.json under [_userid_]["COORDINATES"], then LAT and LON.
-    Note: most of the code of this function comes directely from the Open-Meteo API website.
+    Forecasts are shared by the users of the same grid cell and cached until the next model update (see Forecast.py).
 
     Args:
         id_user (str, optional): user id from the setting file. Defaults to None.
@@ -24,110 +36,81 @@ def get_data(id_user:str =None):
     Returns:
         tuple: returns a tuple, each contains a dataframe, respectively for hourly and daily info
     """
-    # Setup the Open-Meteo API client with cache and retry on error
-    cache_session = requests_cache.CachedSession('.cache', expire_after = 3600)
-    retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-    openmeteo = openmeteo_requests.Client(session = retry_session)
-
-    # Get the user's coordinates
-    if id_user:
-        # lat, lon = settings.get_parameter(id_user)["COORDINATES"]["LAT"], settings.get_parameter(id_user)["COORDINATES"]["LON"]
-        try:
-            lat, lon = settings.get_parameter(id_user)["COORDINATES"]["LAT"], settings.get_parameter(id_user)["COORDINATES"]["LON"]
-        except:
-            id_user = settings.get_parameter("ID_MAIN")
-            lat, lon = settings.get_parameter(id_user)["COORDINATES"]["LAT"], settings.get_parameter(id_user)["COORDINATES"]["LON"]
+    # Get the user's coordinates (falls back on the main user)
+    user = settings.get_user(id_user)
 
-    else:
-        id_user = settings.get_parameter("ID_MAIN")
-        lat, lon = settings.get_parameter(id_user)["COORDINATES"]["LAT"], settings.get_parameter(id_user)["COORDINATES"]["LON"]
-    
-    # Make sure all required weather variables are listed here
-    # The order of variables in hourly or daily is important to assign them correctly below
-    url = settings.get_parameter("URL_OPEN_METEO")
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "current": ["temperature_2m", "apparent_temperature", "precipitation", "weather_code", "cloud_cover", "wind_speed_10m"],
-        "hourly": ["temperature_2m", "relative_humidity_2m", "precipitation", "weather_code", "cloud_cover", "uv_index"],
-        "daily": ["weather_code", "temperature_2m_max", "temperature_2m_min", "uv_index_max", "precipitation_sum", "precipitation_hours"],
-        "timezone": "Europe/Berlin",
-        "forecast_days": 4
-    }
-    responses = openmeteo.weather_api(url, params=params)
-
-    # Process first location. Add a for-loop for multiple locations or weather models
-    response = responses[0]
-    lat = response.Latitude()
-    lon = response.Longitude()
-
-    # Process hourly data. The order of variables needs to be the same as requested.
-    hourly = response.Hourly()
-    hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-    hourly_relative_humidity_2m = hourly.Variables(1).ValuesAsNumpy()
-    hourly_precipitation = hourly.Variables(2).ValuesAsNumpy()
-    hourly_weather_code = hourly.Variables(3).ValuesAsNumpy()
-    hourly_cloud_cover = hourly.Variables(4).ValuesAsNumpy()
-    hourly_uv_index = hourly.Variables(5).ValuesAsNumpy()
-
-    hourly_data = {"date": pd.date_range(
-        start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-        end = pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-        freq = pd.Timedelta(seconds = hourly.Interval()),
-        inclusive = "left"
-    )}
-
-    hourly_data["temperature_2m"] = hourly_temperature_2m
-    hourly_data["relative_humidity_2m"] = hourly_relative_humidity_2m
-    hourly_data["precipitation"] = hourly_precipitation
-    hourly_data["weather_code"] = hourly_weather_code
-    hourly_data["cloud_cover"] = hourly_cloud_cover
-    hourly_data["uv_index"] = hourly_uv_index
-
-    hourly_dataframe = pd.DataFrame(data = hourly_data)
-
-    # Process daily data. The order of variables needs to be the same as requested.
-    daily = response.Daily()
-    daily_weather_code = daily.Variables(0).ValuesAsNumpy()
-    daily_temperature_2m_max = daily.Variables(1).ValuesAsNumpy()
-    daily_temperature_2m_min = daily.Variables(2).ValuesAsNumpy()
-    daily_uv_index_max = daily.Variables(3).ValuesAsNumpy()
-    daily_precipitation_sum = daily.Variables(4).ValuesAsNumpy()
-    daily_precipitation_hours = daily.Variables(5).ValuesAsNumpy()
-
-    daily_data = {"date": pd.date_range(
-        start = pd.to_datetime(daily.Time(), unit = "s", utc = True),
-        end = pd.to_datetime(daily.TimeEnd(), unit = "s", utc = True),
-        freq = pd.Timedelta(seconds = daily.Interval()),
-        inclusive = "left"
-    )}
-    daily_data["weather_code"] = daily_weather_code
-    daily_data["temperature_2m_max"] = daily_temperature_2m_max
-    daily_data["temperature_2m_min"] = daily_temperature_2m_min
-    daily_data["uv_index_max"] = daily_uv_index_max
-    daily_data["precipitation_sum"] = daily_precipitation_sum
-    daily_data["precipitation_hours"] = daily_precipitation_hours
-
-    daily_dataframe = pd.DataFrame(data = daily_data)
-
-    return (hourly_dataframe, daily_dataframe)
-
-
-def find_precipitation(data_hourly:pd.DataFrame):
-    "Returns the hours in the current day at which there will be precipitations, the amount in mm and the weather code."
-
-    # Perform manipulations on the dataframe
-    filtered_df = data_hourly[data_hourly['date'].dt.day == TODAY.day]
-    filtered_df = filtered_df[filtered_df['precipitation']!= 0]
-    hours = filtered_df['date'].dt.hour.tolist()
-    precipitation = filtered_df['precipitation'].tolist()
-    code = filtered_df['weather_code'].tolist()
-
-    # Formatting the values
-    precipitation = list(map(lambda x: round(x, 2), precipitation))
-    code = list(map(lambda x: get_weather_code(int(x)), code))
-
-    return hours, precipitation, code
+    return Forecast.get_forecast(user.lat, user.lon)
+
+
+def prefetch_data(id_users: list):
+    """Fetches the forecasts of several users at once, with a single multi-location request for the cells not cached yet."""
+    users = [settings.get_user(id_user) for id_user in id_users]
+    Forecast.get_forecasts([(user.lat, user.lon) for user in users])
+
+
+def find_precipitation_episodes(times: np.ndarray, precipitation: np.ndarray, codes: np.ndarray, interval: int = 3600, is_day: np.ndarray = None) -> np.ndarray:
+    """Groups consecutive hours of precipitation into episodes, using run-length encoding over the hourly arrays.
+    Arrays can be 1D (one location) or 2D (one row per location, times can then be shared as a 1D array).
+
+    Args:
+        times (np.ndarray): epoch (in seconds) of each value.
+        precipitation (np.ndarray): amount of precipitation in mm.
+        codes (np.ndarray): WMO weather code of each value.
+        interval (int, optional): time between two consecutive values, in seconds. Defaults to 3600.
+        is_day (np.ndarray, optional): 1 during the day, 0 at night (the "is_day" hourly variable). Defaults to None (day).
+
+    Returns:
+        np.ndarray: structured array (EPISODE_DTYPE), one element per episode: location (row), start and end
+        (epoch of the first and last hour with precipitation), total and peak (mm), code (dominant weather code,
+        the most frequent one of the episode, the highest on ties) and is_day (at the peak hour).
+    """
+    precipitation = np.atleast_2d(np.asarray(precipitation, dtype=float))
+    times = np.broadcast_to(np.asarray(times, dtype=np.int64), precipitation.shape)
+    codes = np.broadcast_to(np.nan_to_num(np.asarray(codes, dtype=float)).astype(np.int64), precipitation.shape)
+    is_day = np.broadcast_to(np.nan_to_num(np.asarray(1 if is_day is None else is_day, dtype=float)) > 0, precipitation.shape)
+
+    rows, cols = np.nonzero(precipitation > 0)
+
+    if rows.size == 0:
+        return np.empty(0, dtype=EPISODE_DTYPE)
+
+    wet_times, wet_precipitation, wet_codes, wet_is_day = times[rows, cols], precipitation[rows, cols], codes[rows, cols], is_day[rows, cols]
+
+    # An episode starts at a new location or after a gap in time
+    new_episode = np.ones(rows.size, dtype=bool)
+    new_episode[1:] = (rows[1:] != rows[:-1]) | (np.diff(wet_times) != interval)
+    starts = np.flatnonzero(new_episode)
+    ends = np.append(starts[1:], rows.size) - 1
+    episode = np.cumsum(new_episode) - 1 # episode of each wet hour
+
+    # Hour of the peak: sorted by episode then amount, the last hour of each episode is its peak
+    peaks = np.lexsort((wet_precipitation, episode))[ends]
+
+    # Dominant code: count each (episode, code) pair, then keep the most frequent pair of each episode (highest code on ties)
+    pairs, counts = np.unique(np.stack([episode, wet_codes], axis=1), axis=0, return_counts=True)
+    order = np.lexsort((pairs[:, 1], counts, pairs[:, 0]))
+    last_pairs = np.append(np.flatnonzero(np.diff(pairs[order, 0])), order.size - 1)
+
+    episodes = np.empty(starts.size, dtype=EPISODE_DTYPE)
+    episodes["location"] = rows[starts]
+    episodes["start"] = wet_times[starts]
+    episodes["end"] = wet_times[ends]
+    episodes["total"] = np.add.reduceat(wet_precipitation, starts)
+    episodes["peak"] = np.maximum.reduceat(wet_precipitation, starts)
+    episodes["code"] = pairs[order[last_pairs], 1]
+    episodes["is_day"] = wet_is_day[peaks]
+
+    return episodes
+
+
+def find_precipitation(data_hourly:pd.DataFrame, day: int = None) -> np.ndarray:
+    "Returns the precipitation episodes of the current day, or of the given day of the month (see find_precipitation_episodes)."
+
+    day = Clock.today().day if day is None else day
+    filtered_df = data_hourly[data_hourly['date'].dt.day == day]
+    times = filtered_df['date'].astype("int64").to_numpy() // 10**9
+
+    return find_precipitation_episodes(times, filtered_df['precipitation'].to_numpy(), filtered_df['weather_code'].to_numpy(), is_day=filtered_df['is_day'].to_numpy())
 
 def summarize(id_user:str =None):
     """Extracts relevant information about the weather, relevant for the specified id_user.
@@ -139,33 +122,75 @@ def summarize(id_user:str =None):
         weather_code: identifier of the overall weather.
         min_temp: minimum temperature. 
         max_temp: maximum temperature.
-        precip: tuple or float. If tuple: ([hours of precipitation], [hourly precipitations in mm], [hourly weather code _str_])
+        precip: np.ndarray or float. If array: the precipitation episodes of the day (see find_precipitation_episodes), 0 if none.
         precip_total: sum of all precipitations.
 
     """
     hourly, daily = get_data(id_user=id_user)
+    today = Clock.today()
     
-    current_day_infos = daily[daily['date'].dt.day == TODAY.day]
+    current_day_infos = daily[daily['date'].dt.day == today.day]
 
     weather_code, min_temp, max_temp = current_day_infos.weather_code.iloc[0], current_day_infos.temperature_2m_min.iloc[0], current_day_infos.temperature_2m_max.iloc[0]
     
     # Now expore the precipitations: 
-    hours, precipitation, code = find_precipitation(hourly) # returns 3 lists, for each hours of precipitations, the amount and the weather code
+    episodes = find_precipitation(hourly, day=today.day) # one element per episode of consecutive hours of precipitation
 
-    # Check if the lists are empty
-    if len(hours) == 0:
+    # Check if there is no precipitation
+    if len(episodes) == 0:
         precip = 0
         precip_total = 0
 
     else:
-        precip_total = sum(precipitation)
-        precip = (hours, precipitation.copy(), code)
+        precip_total = round(float(episodes["total"].sum()), 2)
+        precip = episodes
 
     weather_code = get_weather_code(int(weather_code))
     
     return weather_code, min_temp, max_temp, precip, precip_total
 
 
+def get_summary(id_user:str =None) -> tuple:
+    """Returns the summary of the day of the user (see summarize), from memory if it was already computed today."""
+
+    today = Clock.today()
+    cached = _SUMMARIES.get(str(id_user))
+
+    if cached and cached[0] == today:
+        return cached[1]
+
+    summary = summarize(id_user=id_user)
+    with _SUMMARIES_LOCK:
+        _SUMMARIES[str(id_user)] = (today, summary)
+
+    return summary
+
+
+def precompute_summaries(id_users: list):
+    """Computes the summary of the day of each user and replaces the stored summaries with them, so that the users
+    removed from the settings are dropped. The forecasts of all users are fetched beforehand in a single
+    multi-location request. A user whose summary fails is logged and skipped (get_summary computes it on demand).
+    Meant to be scheduled early every morning."""
+    global _SUMMARIES
+
+    try:
+        prefetch_data(id_users)
+    except Exception as exp:
+        logger.warning("Forecasts could not be prefetched, fetching them user by user: %r", exp)
+
+    today = Clock.today()
+    summaries = {}
+
+    for id_user in id_users:
+        try:
+            summaries[str(id_user)] = (today, summarize(id_user=id_user))
+        except Exception:
+            logger.exception("Weather summary of user %s failed", id_user)
+
+    with _SUMMARIES_LOCK:
+        _SUMMARIES = summaries
+
+
 def string_to_export(weather_code, min_temp, max_temp, precip, precip_total) -> str:
     """Uses all relevant information and formats it into a string to export.
 
@@ -173,7 +198,7 @@ def string_to_export(weather_code, min_temp, max_temp, precip, precip_total) ->
         weather_code (str): identifier of the overall weather.
         min_temp (float): minimum temperature. 
         max_temp (float): maximum temperature.
-        precip (float or tuple): tuple or float. If tuple: ([hours of precipitation], [hourly precipitations in mm], [hourly weather code _str_])
+        precip (np.ndarray or float): precipitation episodes of the day, or 0 if none.
         precip_total (float): sum of all precipitations.
  
     Returns:
@@ -187,25 +212,21 @@ def string_to_export(weather_code, min_temp, max_temp, precip, precip_total) ->
 
     if precip_total > 0:
 
-        time, prec = handle_hourly_precipitations(list_hours=precip[0], list_precip=precip[1])
+        start_hours = (precip["start"] // 3600) % 24
+        end_hours = (precip["end"] // 3600) % 24
+        descriptions = translate_weather_codes(precip["code"], is_day=precip["is_day"])
 
         output_time = []
-        output_precip = [] 
-
-        for i in range(len(time)):
-            if len(time[i]) > 1: # precipitation during some hours, consecutive
-                time_str = f"{int(time[i][0])}h - {int(time[i][-1])}h"
-                prec_str = sum(prec[i])
-                output_time.append(time_str)
-                output_precip.append(prec_str)
-            
+        output_precip = []
+
+        for start_hour, end_hour, total, description in zip(start_hours, end_hours, precip["total"], descriptions):
+            if start_hour != end_hour: # precipitation during some hours, consecutive
+                output_time.append(f"{start_hour}h - {end_hour}h")
             else: # precipitation during 1 hour only
-                time_str = f"At {time[i]}h"
-                prec_str = prec[i]
-                output_time.append(time_str)
-                output_precip.append(prec_str)
+                output_time.append(f"At {start_hour}h")
+            output_precip.append(f"{round(float(total), 2)}mm ({description})")
 
-        intermediary_string = "\n - ".join([str(output_time[i])+ ": " + str(output_precip[i]) + "mm." for i in range(len(output_precip))])
+        intermediary_string = "\n - ".join([str(output_time[i])+ ": " + str(output_precip[i]) + "." for i in range(len(output_precip))])
         precip_string = f"\n☔️ Precipitations: \n - {intermediary_string}"
         
     else:
@@ -216,62 +237,59 @@ def string_to_export(weather_code, min_temp, max_temp, precip, precip_total) ->
     return text_out
     
 
-def order_list_int(numbers:list):
-    """Returns list of list containing consecutive integers.
-    [24, 19, 25, 14, 15, 17, 18, 27, 26, 23, 16] -> [[14, 15, 16, 17, 18, 19], [23, 24, 25, 26, 27]]
-    [24, 25, 27, 26, 23, 16] -> [[16], [23, 24, 25, 26, 27]]"""
-
-    numbers = list(map(lambda x: float(x), numbers))
-    
-    numbers = sorted(numbers)
-    result = []
-    temp = [numbers[0]]
-    for i in range(1, len(numbers)):
-        if numbers[i] - numbers[i-1] == 1:
-            temp.append(numbers[i])
-        else:
-            result.append(temp)
-            temp = [numbers[i]]
-    result.append(temp)
-
-    return result
-
-def handle_hourly_precipitations(list_hours:list, list_precip:list):
-    """ Takes the list of hours of precipitations, and list of hourly amount of precipitation. Creates sublists of consecutive hours, and the corresponding sublists of precipitation.
-    Entries: 
-    list_hours = [0.0, 1.0, 2.0, 19.0, 20.0, 21.0, 22.0, 23.0]
-    list_precip= [0.4, 2.9, 0.6, 1.6, 4.4, 4.0, 3.4, 1.2]
-
-    Output:
-    ([[0.0, 1.0, 2.0], [19.0, 20.0, 21.0, 22.0, 23.0]], [[0.4, 2.9, 0.6], [1.6, 4.4, 4.0, 3.4, 1.2]])
-"""
-
-    # Consecutive precipitation hours
-    sub_lists_hours = order_list_int(list_hours)
-
-    sub_lists_mm = list()
-
-    # Associate the precipitations
-    for consecutive in sub_lists_hours:
-        sub_lists_mm_round = [list_precip[list_hours.index(x)] for x in consecutive]
-        sub_lists_mm.append(sub_lists_mm_round)
-
-    return sub_lists_hours, sub_lists_mm
-
-def get_weather_code(code:int) -> str:
-    """Function that takes as input the weather code (int) and uses the table in *weather_code.json* to translate it."""
-
-    path_file = os.path.dirname(os.path.abspath(__file__)) + "/weather_code.json"
+def load_weather_codes(path_file: str = PATH_WEATHER_CODES) -> tuple:
+    """Loads the table of *weather_code.json* into two dense arrays (day and night descriptions) indexed by WMO code.
+    The last cell of each array holds "None", used for unknown codes."""
 
     with open(path_file, "r") as f:
         data = json.load(f)
-    
+
+    size = max(int(code) for code in data) + 2
+    day = np.full(size, "None", dtype=object)
+    night = np.full(size, "None", dtype=object)
+
+    for code, descriptions in data.items():
+        day[int(code)] = descriptions["day"]["description"]
+        night[int(code)] = descriptions["night"]["description"]
+
+    return day, night
+
+WEATHER_CODES_DAY, WEATHER_CODES_NIGHT = load_weather_codes()
+
+
+def translate_weather_codes(codes: np.ndarray, is_day=True) -> np.ndarray:
+    """Translates an array of weather codes in one vectorized call.
+
+    Args:
+        codes (np.ndarray): WMO weather codes (float or int, NaN allowed).
+        is_day (bool or np.ndarray, optional): day (True) or night (False) description, for all codes or per code
+            (e.g. the "is_day" hourly variable of Open-Meteo). Defaults to True.
+
+    Returns:
+        np.ndarray: array of descriptions ("None" for unknown codes).
+    """
+    codes = np.asarray(codes, dtype=float)
+    unknown = len(WEATHER_CODES_DAY) - 1
+
+    # Unknown (NaN, negative or too large) codes point to the "None" cell
+    valid = np.isfinite(codes) & (codes >= 0) & (codes < unknown)
+    index = np.where(valid, np.nan_to_num(codes), unknown).astype(int)
+
+    return np.where(np.asarray(is_day, dtype=bool), WEATHER_CODES_DAY[index], WEATHER_CODES_NIGHT[index])
+
+
+def get_weather_code(code:int, is_day: bool = True) -> str:
+    """Function that takes as input the weather code (int) and uses the table in *weather_code.json* to translate it."""
+
     try:
-        weather_code = data[str(code)]["day"]["description"]
-    except:
-        weather_code = "None"
+        code = int(code)
+    except (TypeError, ValueError):
+        return "None"
+
+    if 0 <= code < len(WEATHER_CODES_DAY):
+        return WEATHER_CODES_DAY[code] if is_day else WEATHER_CODES_NIGHT[code]
 
-    return weather_code
+    return "None"
 
 if __name__ == "__main__":
 
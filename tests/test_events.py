@@ -0,0 +1,56 @@
+from datetime import date
+from zoneinfo import ZoneInfo
+from unittest import mock
+import unittest
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from Calendar import Events
+from Utils import Clock
+
+# Negative offset: midnight UTC is still the previous day there
+TIMEZONE = ZoneInfo("America/New_York")
+CALENDAR = "test@calendar"
+
+
+def make_item(start: dict, end: dict, summary: str) -> dict:
+    return {"start": start, "end": end, "summary": summary, "location": "Somewhere"}
+
+
+class AllDayEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(Clock, "get_timezone", return_value=TIMEZONE)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.all_day = Events.from_item(make_item({"date": "2024-03-15"}, {"date": "2024-03-16"}, "Holiday"), CALENDAR, offset=2)
+        self.meeting = Events.from_item(make_item({"dateTime": "2024-03-15T09:30:00-04:00"}, {"dateTime": "2024-03-15T10:30:00-04:00"}, "Meeting"), CALENDAR)
+
+    def test_all_day_event_starts_at_local_midnight(self):
+        self.assertTrue(self.all_day.all_day)
+        self.assertEqual(self.all_day.start_time.date(), date(2024, 3, 15))
+        self.assertEqual(self.all_day.start_time.strftime("%H:%M"), "00:00")
+
+    def test_all_day_event_in_its_day_window(self):
+        t0, t1 = Events.day_window(date(2024, 3, 15))
+        self.assertTrue(t0 <= self.all_day.start < t1)
+
+        t0, t1 = Events.day_window(date(2024, 3, 14))
+        self.assertFalse(t0 <= self.all_day.start < t1)
+
+    def test_first_event_skips_all_day_events(self):
+        index = Events.EventIndex({CALENDAR: sorted([self.all_day, self.meeting], key=lambda event: event.start)})
+
+        self.assertEqual(index.first_event_on(date(2024, 3, 15)), self.meeting)
+        self.assertIsNone(index.first_event_on(date(2024, 3, 14)))
+
+    def test_only_all_day_events(self):
+        index = Events.EventIndex({CALENDAR: [self.all_day]})
+
+        self.assertIsNone(index.first_event_on(date(2024, 3, 15)))
+
+
+if __name__ == "__main__":
+    unittest.main()